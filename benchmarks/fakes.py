@@ -0,0 +1,136 @@
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+
+import numpy as np
+
+
+# This file holds deterministic local stand-ins for the Vertex AI clients used by the benchmarks
+# 1 > FakeVertexAIEmbeddings: hashed bag-of-words vectors, so similar texts get similar vectors
+# 2 > FakeVertexAI: returns well formed quiz questions (single or batch) built from the prompt
+# both have a configurable latency and error rate, errors look like 429 ResourceExhausted
+
+
+class FakeQuotaError(Exception):
+    """
+    Raised by the fakes to simulate an exhausted Vertex AI quota.
+    """
+    
+    code = 429
+    
+    def __init__(self):
+        super().__init__("429 ResourceExhausted: fake quota exceeded")
+
+
+class _FakeBackend:
+    
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        """
+        :param latency: Seconds every call takes.
+        :param error_rate: Probability in [0, 1] that a call fails with FakeQuotaError.
+        :param seed: Seed of the error draws.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise FakeQuotaError()
+
+
+class FakeVertexAIEmbeddings(_FakeBackend):
+    """
+    Embeds texts as L2-normalized hashed bag-of-words vectors.
+    """
+    
+    def __init__(self, dimensions=768, latency=0.0, error_rate=0.0, seed=0):
+        super().__init__(latency, error_rate, seed)
+        self.dimensions = dimensions
+        self.texts_embedded = 0
+    
+    def _vector(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in re.findall(r"\w+", text.casefold()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+    
+    def embed_documents(self, texts):
+        self._call()
+        with self._lock:
+            self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+    
+    def embed_query(self, text):
+        self._call()
+        return self._vector(text)
+
+
+class FakeVertexAI(_FakeBackend):
+    """
+    Answers quiz prompts with valid question JSON, one object or an array for batch prompts.
+    
+    Questions are derived from a hash of the prompt and a call counter, so every call
+    produces a distinct question and runs are reproducible.
+    """
+    
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, chunk_size=16):
+        """
+        :param chunk_size: Number of characters per streamed chunk.
+        """
+        super().__init__(latency, error_rate, seed)
+        self.chunk_size = chunk_size
+        self.chunks_streamed = 0
+    
+    def _question(self, prompt, index):
+        digest = hashlib.sha256(f"{prompt}:{self.calls}:{index}".encode("utf-8")).hexdigest()
+        words = [digest[i:i + 6] for i in range(0, 36, 6)]
+        return {
+            "question": f"Which statement about {words[0]} {words[1]} and {words[2]} is correct?",
+            "choices": [
+                {"key": key, "value": f"{key} {word}"} for key, word in zip("ABCD", words[2:])
+            ],
+            "answer": "ABCD"[int(digest[-1], 16) % 4],
+            "explanation": f"The context describes {words[3]} in relation to {words[4]}."
+        }
+    
+    def _response(self, prompt):
+        self._call()
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        batch = re.search(r"create (\d+) quiz questions", text)
+        if batch:
+            body = json.dumps([self._question(text, i) for i in range(int(batch.group(1)))], indent=2)
+        else:
+            body = json.dumps(self._question(text, 0), indent=2)
+        # real responses often come fenced and followed by prose
+        return f"```json\n{body}\n```\nLet me know if you need more questions."
+    
+    # generation parameters passed per call (max_output_tokens) are accepted like VertexAI does, and ignored
+    def invoke(self, prompt, **params):
+        return self._response(prompt)
+    
+    def __call__(self, prompt, **params):
+        return self._response(prompt)
+    
+    def stream(self, prompt, **params):
+        response = self._response(prompt)
+        for start in range(0, len(response), self.chunk_size):
+            with self._lock:
+                self.chunks_streamed += 1
+            yield response[start:start + self.chunk_size]
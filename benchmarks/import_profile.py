@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+# Reports the import cost of every screen of the app using `python -X importtime`.
+# Each target is imported in a fresh interpreter, so the numbers are cold-start costs:
+#
+#   python benchmarks/import_profile.py --top 15
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# what each step of the app imports, in the order a user reaches them
+TARGETS = {
+    "startup": ["main"],
+    "quiz_builder": ["tasks.Document_Ingestion.document_ingestion"],
+    "quiz_submit": [
+        "tasks.Embedding_Client_Creator.embedding_client_creator",
+        "tasks.Chroma_Collection_Creator.chroma_collection_creator",
+        "tasks.Quiz_Algo.quiz_algo"
+    ],
+    "quiz_screen": ["tasks.Quiz_Manager.quiz_manager"],
+    "vertexai": ["langchain_google_vertexai"]
+}
+
+
+def profile(modules):
+    """
+    Imports the modules in a fresh interpreter and parses the -X importtime report.
+
+    :return: A dictionary with the total import time and the (cumulative_us, self_us, module) rows.
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd= ROOT, capture_output= True, text= True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented by two spaces per level after the separator
+        rows.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+
+    # the cumulative times of the top level imports add up to the total
+    total_us = sum(cumulative for cumulative, _, name in rows if not name.startswith(" "))
+    return {"ok": result.returncode == 0, "total_ms": round(total_us / 1000, 1), "rows": rows, "error": result.stderr[-500:] if result.returncode else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description= "Import time profile of the Gemini Quizzify screens")
+    parser.add_argument("--top", type= int, default= 10, help= "slowest modules listed per target")
+    parser.add_argument("--targets", nargs= "+", default= list(TARGETS), choices= list(TARGETS))
+    parser.add_argument("--json", action= "store_true", help= "print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for target in args.targets:
+        result = profile(TARGETS[target])
+        slowest = sorted(result["rows"], reverse= True)[:args.top]
+        report[target] = {
+            "modules": TARGETS[target],
+            "ok": result["ok"],
+            "total_ms": result["total_ms"],
+            "slowest": [
+                {"module": name.strip(), "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+                for cumulative, self_us, name in slowest
+            ]
+        }
+        if result["error"]:
+            report[target]["error"] = result["error"]
+
+    if args.json:
+        print(json.dumps(report, indent= 2))
+        return report
+
+    for target, entry in report.items():
+        status = "" if entry["ok"] else "  (import failed)"
+        print(f"{target}: {entry['total_ms']} ms{status}")
+        for row in entry["slowest"]:
+            print(f"    {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fakes import FakeVertexAIEmbeddings
+from benchmarks.synthetic import make_corpus
+from tasks.Vector_Index.vector_index import NumpyVectorStore, normalize_rows, top_k
+
+
+# Recall versus memory of the quantized storage modes of the NumPy vector store.
+# Chunks are the paragraphs of a synthetic corpus, queries are sentences taken from random chunks,
+# recall@k is measured against an exact float32 search. index_bytes counts the searched matrix plus, for int8,
+# one float32 scale per row (scale_bytes), which is why the int8 memory_ratio is just under 4 (3.98 at 768 dims):
+#
+#   python benchmarks/quantization_benchmark.py --chunks 1000 10000 50000 --output quantization.json
+
+
+def make_chunks(num_chunks, seed=0):
+    """
+    :return: num_chunks paragraph texts of a synthetic corpus.
+    """
+    pages = make_corpus(num_chunks // 4 + 1, seed= seed)
+    paragraphs = [block for page in pages for block in page.split("\n\n")[1:]]
+    return paragraphs[:num_chunks]
+
+
+def make_queries(chunks, num_queries, rng):
+    queries = []
+    for chunk in rng.sample(chunks, min(num_queries, len(chunks))):
+        sentences = [sentence for sentence in chunk.split(". ") if sentence]
+        queries.append(rng.choice(sentences))
+    return queries
+
+
+def bench_size(num_chunks, args):
+    rng = random.Random(args.seed)
+    embeddings = FakeVertexAIEmbeddings(dimensions= args.dimensions, seed= args.seed)
+    chunks = make_chunks(num_chunks, seed= args.seed)
+    vectors = normalize_rows(embeddings.embed_documents(chunks))
+    queries = normalize_rows([embeddings.embed_query(query) for query in make_queries(chunks, args.queries, rng)])
+
+    # exact float32 neighbours as the ground truth
+    truth = [set(top_k(vectors @ query, args.k).tolist()) for query in queries]
+
+    ids = [str(index) for index in range(len(chunks))]
+    metadatas = [{"index": index} for index in range(len(chunks))]
+    results = []
+    itemsizes = {"float32": 4, "float16": 2, "int8": 1}
+    for precision in ("float32", "float16", "int8"):
+        for rescore_factor in ([1] if precision == "float32" else [1] + args.rescore_factors):
+            store = NumpyVectorStore(embeddings, precision= precision, rescore_factor= rescore_factor)
+            store.add_vectors(vectors, ids, chunks, metadatas)
+
+            latencies = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = store.similarity_search_by_vector_with_score(query, k= args.k)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & {document.metadata["index"] for document, _ in found})
+
+            latencies.sort()
+            matrix_bytes = len(chunks) * args.dimensions * itemsizes[precision]
+            results.append({
+                "precision": precision,
+                "rescore_factor": rescore_factor,
+                "index_bytes": store.index_nbytes(),
+                "matrix_bytes": matrix_bytes,
+                "scale_bytes": store.index_nbytes() - matrix_bytes,
+                "memory_ratio": round(vectors.nbytes / store.index_nbytes(), 2),
+                f"recall_at_{args.k}": round(hits / (len(queries) * args.k), 4),
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+                "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3)
+            })
+    return {"chunks": len(chunks), "dimensions": args.dimensions, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description= "Recall versus memory of quantized vector storage")
+    parser.add_argument("--chunks", type= int, nargs= "+", default= [1000, 10000], help= "collection sizes in chunks")
+    parser.add_argument("--dimensions", type= int, default= 768, help= "embedding dimensions")
+    parser.add_argument("--queries", type= int, default= 200, help= "queries per collection")
+    parser.add_argument("--k", type= int, default= 10, help= "neighbours per query")
+    parser.add_argument("--rescore-factors", type= int, nargs= "+", default= [4],
+                        help= "candidates rescored in float32, as multiples of k")
+    parser.add_argument("--seed", type= int, default= 0)
+    parser.add_argument("--output", help= "write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {"config": vars(args), "results": [bench_size(num_chunks, args) for num_chunks in args.chunks]}
+    text = json.dumps(report, indent= 2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
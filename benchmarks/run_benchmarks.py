@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import contextlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fakes import FakeVertexAI, FakeVertexAIEmbeddings
+from benchmarks.synthetic import VOCABULARY, make_uploads
+from tasks.Document_Ingestion.document_ingestion import STREAM_MIN_PAGES, DocumentProcessor, IngestionCache
+from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
+from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator
+from tasks.Quiz_Algo.quiz_algo import QuizGenerator
+from tasks.Question_Dedup.question_dedup import QuestionDedupIndex
+from tasks.Rate_Limiter.rate_limiter import TokenBucket
+from tasks.Tracing.tracing import tracer
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+# Offline benchmark of the quiz pipeline, no Vertex AI access needed.
+# Runs ingestion, chunking, collection build, retrieval, question generation and dedup
+# over synthetic corpora and prints the results as JSON:
+#
+#   python benchmarks/run_benchmarks.py --pages 10 100 1000 --output bench.json
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, items, elapsed):
+    """
+    :param latencies: Duration of every measured operation in seconds.
+    :param items: Number of items (pages, chunks, queries, ...) processed by the stage.
+    :param elapsed: Wall clock duration of the stage in seconds.
+    """
+    return {
+        "items": items,
+        "operations": len(latencies),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_per_s": round(items / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_corpus(num_pages, args):
+    stages = {}
+    tracer.reset()
+    rng = random.Random(args.seed)
+    uploads = make_uploads(num_pages, pages_per_file= args.pages_per_file, seed= args.seed)
+
+    # ingestion, with a private cache so nothing is served from an earlier run
+    processor = DocumentProcessor(cache= IngestionCache(), stream_min_pages= args.stream_min_pages)
+    _, elapsed = timed(processor.process_uploads, uploads, parallel= not args.serial_ingestion)
+    stages["ingestion"] = summarize([elapsed], processor.page_count, elapsed)
+
+    embeddings = FakeVertexAIEmbeddings(latency= args.embed_latency, error_rate= args.error_rate, seed= args.seed)
+    embed_client = EmbeddingClient("fake-embedding", None, None, backend= embeddings)
+    creator = ChromaCollectionCreator(processor, embed_client, backend= args.vector_backend,
+                                      retrieval_mode= args.retrieval_mode)
+
+    # chunking, the windows of distinct chunks the collection build embeds
+    windows, elapsed = timed(lambda: [len(window) for window in creator.iter_chunk_windows(set())])
+    chunk_count = sum(windows)
+    stages["chunking"] = summarize([elapsed], chunk_count, elapsed)
+
+    # collection build, embedding included
+    _, elapsed = timed(creator.create_chroma_collection)
+    stages["collection_build"] = summarize([elapsed], chunk_count, elapsed)
+    stages["collection_build"]["embedding_calls"] = embeddings.calls
+    stages["collection_build"]["embedding_errors"] = embeddings.errors
+
+    # retrieval, distinct queries so the retrieval cache does not hide the vector search
+    latencies = []
+    embedding_calls = embeddings.calls
+    start = time.perf_counter()
+    for index in range(args.queries):
+        query = f"{' '.join(rng.sample(VOCABULARY, 2))} {index}"
+        _, elapsed = timed(creator.retrieve, query, 4)
+        latencies.append(elapsed)
+    stages["retrieval"] = summarize(latencies, args.queries, time.perf_counter() - start)
+    stages["retrieval"]["embedding_calls"] = embeddings.calls - embedding_calls
+
+    # question generation
+    llm = FakeVertexAI(latency= args.llm_latency, error_rate= args.error_rate, seed= args.seed)
+    latencies = []
+    first_question_latencies = []
+    questions = 0
+    start = time.perf_counter()
+    for _ in range(args.quizzes):
+        generator = QuizGenerator(
+            rng.choice(VOCABULARY), args.questions, creator, llm= llm,
+            rate_limiter= TokenBucket(requests_per_minute= args.requests_per_minute)
+        )
+        # questions are streamed as the app shows them, the first one is the latency users feel
+        quiz_start = time.perf_counter()
+        for position, _ in enumerate(generator.iter_quiz(batch= args.batch)):
+            if position == 0:
+                first_question_latencies.append(time.perf_counter() - quiz_start)
+            questions += 1
+        latencies.extend(generator.timings["llm"])
+    stages["question_generation"] = summarize(latencies, questions, time.perf_counter() - start)
+    stages["question_generation"]["first_question_p50_ms"] = (
+        round(percentile(first_question_latencies, 0.50) * 1000, 3) if first_question_latencies else None
+    )
+    stages["question_generation"]["llm_calls"] = llm.calls
+    stages["question_generation"]["llm_errors"] = llm.errors
+
+    # dedup over a large bank of generated questions
+    index = QuestionDedupIndex()
+    bank = [llm._question("dedup", i)["question"] for i in range(args.dedup_questions)]
+    latencies = []
+    start = time.perf_counter()
+    for text in bank:
+        _, elapsed = timed(index.check_and_add, text)
+        latencies.append(elapsed)
+    stages["dedup"] = summarize(latencies, len(bank), time.perf_counter() - start)
+
+    # per stage spans recorded by the pipeline itself, the dedup stage above is measured here only
+    return {"pages": num_pages, "files": len(uploads), "stages": stages, "trace": tracer.summary()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description= "Offline benchmark of the Gemini Quizzify pipeline")
+    parser.add_argument("--pages", type= int, nargs= "+", default= [10, 100, 1000],
+                        help= "corpus sizes in pages, e.g. 10 100 1000 10000")
+    parser.add_argument("--embed-latency", type= float, default= 0.05, help= "seconds per fake embedding call")
+    parser.add_argument("--llm-latency", type= float, default= 0.5, help= "seconds per fake LLM call")
+    parser.add_argument("--error-rate", type= float, default= 0.0, help= "probability of a fake 429 per call")
+    parser.add_argument("--queries", type= int, default= 100, help= "retrieval queries per corpus")
+    parser.add_argument("--quizzes", type= int, default= 2, help= "quizzes generated per corpus")
+    parser.add_argument("--questions", type= int, default= 10, help= "questions per quiz")
+    parser.add_argument("--batch", action= "store_true", help= "generate quizzes in batch mode")
+    parser.add_argument("--requests-per-minute", type= int, default= 600, help= "LLM rate limit")
+    parser.add_argument("--dedup-questions", type= int, default= 1000, help= "questions fed to the dedup index")
+    parser.add_argument("--serial-ingestion", action= "store_true", help= "parse PDFs in the calling process")
+    parser.add_argument("--vector-backend", choices= ["chroma", "numpy"], default= "chroma",
+                        help= "vector store behind the collection creator")
+    parser.add_argument("--pages-per-file", type= int, default= 200, help= "pages per synthetic PDF")
+    parser.add_argument("--stream-min-pages", type= int, default= STREAM_MIN_PAGES,
+                        help= "PDFs with more pages are parsed while the collection is built")
+    parser.add_argument("--retrieval-mode", choices= ["vector", "hybrid", "lexical"], default= "hybrid",
+                        help= "dense, fused BM25 and dense, or BM25 only retrieval")
+    parser.add_argument("--seed", type= int, default= 0)
+    parser.add_argument("--output", help= "write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    # the pipeline reports progress through streamlit, which only logs warnings outside of `streamlit run`
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    # progress messages of the pipeline go to stderr so stdout only carries the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = {
+            "config": vars(args),
+            "results": [bench_corpus(num_pages, args) for num_pages in args.pages]
+        }
+    text = json.dumps(report, indent= 2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import random
+
+
+# This file builds synthetic course material for the benchmarks
+# 1 > generates pages of headed, paragraph structured text from a fixed vocabulary
+# 2 > renders pages into minimal, valid PDF files that pypdf can parse
+
+
+VOCABULARY = (
+    "cell membrane mitochondria nucleus ribosome enzyme protein glucose photosynthesis "
+    "respiration krebs cycle atp dna rna transcription translation mutation gene chromosome "
+    "evolution selection population ecosystem energy carbon nitrogen water osmosis diffusion "
+    "lipid receptor hormone neuron signal pathway metabolism catalyst substrate inhibitor"
+).split()
+
+
+def make_page(rng, page_number, paragraphs=4, sentences=5):
+    """
+    :return: The text of one page, a heading followed by paragraphs separated by blank lines.
+    """
+    heading = f"Section {page_number + 1}: {' '.join(rng.sample(VOCABULARY, 3)).title()}"
+    blocks = [heading]
+    for _ in range(paragraphs):
+        sentence_list = []
+        for _ in range(sentences):
+            words = rng.choices(VOCABULARY, k=rng.randint(8, 16))
+            sentence_list.append(" ".join(words).capitalize() + ".")
+        blocks.append(" ".join(sentence_list))
+    return "\n\n".join(blocks)
+
+
+def make_corpus(num_pages, seed=0):
+    """
+    :return: A list of page texts.
+    """
+    rng = random.Random(seed)
+    return [make_page(rng, page_number) for page_number in range(num_pages)]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text, width=95):
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def make_pdf(pages):
+    """
+    Renders page texts into the bytes of a minimal PDF, one text page per entry.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    kids = []
+    for text in pages:
+        operations = ["BT /F1 9 Tf 36 806 Td 11 TL"]
+        for line in _wrap(text):
+            operations.append(f"({_escape(line)}) Tj T*")
+        operations.append("ET")
+        stream = "\n".join(operations).encode("latin-1", "replace")
+        
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode("ascii")
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode("ascii")
+    
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("ascii")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(output)
+
+
+class SyntheticUpload:
+    """
+    Mimics the streamlit UploadedFile interface used by DocumentProcessor.
+    """
+    
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+    
+    def getvalue(self):
+        return self.data
+
+
+def make_uploads(num_pages, pages_per_file=200, seed=0):
+    """
+    :return: A list of SyntheticUpload PDFs holding num_pages pages in total.
+    """
+    corpus = make_corpus(num_pages, seed)
+    return [
+        SyntheticUpload(f"synthetic_{seed}_{start // pages_per_file}.pdf", make_pdf(corpus[start:start + pages_per_file]))
+        for start in range(0, num_pages, pages_per_file)
+    ]
@@ -4,13 +4,47 @@ import sys
 import json
 
 
-# Import the necessary modules for document processing, embedding, quiz generation, and quiz management
+# The modules for document processing, embedding, quiz generation, and quiz management are imported
+# inside the screen that needs them: python caches imported modules for the life of the process, so
+# each one is loaded once, on the first rerun that shows its screen.
+# Run `python benchmarks/import_profile.py` to see what every screen costs to import.
+
+# The embedding client (with its VertexAI connection and on-disk cache) is created once per configuration
+# and shared by every rerun and every user session of this server process
+@st.cache_resource(show_spinner= False)
+def get_embedding_client(**embed_config):
+    from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
+    return EmbeddingClient(**embed_config)
+
+
+# The question bank store and its background pre-generator are shared by every session, so a bank
+# grown for one student's (document set, topic) serves the rest of the class
+@st.cache_resource(show_spinner= False)
+def get_question_bank(path):
+    from tasks.Question_Bank.question_bank import QuestionBankStore, BankPregenerator
+    store= QuestionBankStore(path)
+    return store, BankPregenerator(store)
+
+
+# LLM responses keyed by prompt fingerprint, shared by every session so regenerated quizzes do not hit the quota again
+@st.cache_resource(show_spinner= False)
+def get_response_cache(path):
+    from tasks.Generation_Cache.generation_cache import GenerationCache
+    return GenerationCache(path, variants= 3)
+
+
+# shown while the rest of the quiz is generated in the background, the whole page is rerun
+# once the quiz is complete so that the progress line goes away, unless generation failed
+# and the error stays in its place
+@st.fragment(run_every= 1)
+def show_generation_progress(quiz_manager):
+    if quiz_manager.error is not None:
+        st.error(f"Quiz generation stopped after {quiz_manager.total_questions} questions: {quiz_manager.error}", icon= "🚨")
+    elif quiz_manager.is_complete():
+        st.rerun()
+    else:
+        st.caption(f"{quiz_manager.total_questions} of {quiz_manager.expected_questions} questions ready, generating the rest...")
 
-from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
-from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
-from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator
-from tasks.Quiz_Algo.quiz_algo import QuizGenerator
-from tasks.Quiz_Manager.quiz_manager import QuizManager
 
 if __name__ == "__main__":
     
@@ -18,9 +52,40 @@ if __name__ == "__main__":
     embed_config= {
         "model_name": "textembedding-gecko@003",
         "project": "gemini-quizzify-21082024",
-        "location": "us-central1"
+        "location": "us-central1",
+        # persistent embedding cache, re-uploaded documents are served from disk
+        "cache_path": os.path.join(os.path.expanduser("~"), ".cache", "quizzify", "embeddings.sqlite3")
     }
     
+    # on-disk vector store shared by every session, one collection per uploaded document set
+    chroma_directory= os.path.join(os.path.expanduser("~"), ".cache", "quizzify", "chroma")
+    
+    # quizzes are built from a few PDFs, an in-process NumPy index is enough ("chroma" for a Chroma client)
+    vector_backend= "numpy"
+    
+    # the NumPy index is searched as int8 (4x less memory), the best candidates are rescored in float32
+    vector_precision= "int8"
+    
+    # persistent question banks indexed by document set and topic
+    question_bank_path= os.path.join(os.path.expanduser("~"), ".cache", "quizzify", "question_bank.sqlite3")
+    
+    # persistent cache of LLM responses
+    response_cache_path= os.path.join(os.path.expanduser("~"), ".cache", "quizzify", "responses.sqlite3")
+    
+    # with QUIZZIFY_SERVICE_URL set, ingestion, indexing and quiz generation run on the quiz service
+    # (tasks/Quiz_Service/quiz_service.py) and this app is only its user interface
+    service_url= os.environ.get("QUIZZIFY_SERVICE_URL")
+    
+    # QUIZZIFY_METRICS_PORT serves the per stage metrics to Prometheus on http://<host>:<port>/metrics
+    if os.environ.get("QUIZZIFY_METRICS_PORT"):
+        from tasks.Tracing.tracing import start_metrics_server
+        start_metrics_server(int(os.environ["QUIZZIFY_METRICS_PORT"]))
+    
+    # QUIZZIFY_DEBUG=1 (or ?debug=1 in the URL) adds the pipeline metrics panel to the sidebar
+    if os.environ.get("QUIZZIFY_DEBUG") or st.query_params.get("debug"):
+        from tasks.Tracing.tracing import render_debug_panel
+        render_debug_panel()
+    
     # Check if the question bank exists in session state or if it's empty
     if 'question_bank' not in st.session_state or len(st.session_state['question_bank']) == 0:
         st.session_state['question_bank'] = []
@@ -33,13 +98,15 @@ if __name__ == "__main__":
             with st.form("Load Data to Chroma"):
                 st.write("Select PDFs for Ingestions, the topic for the quiz, and click Generate!")
                 
-                # Initialize the document processor to ingest PDFs
-                processor= DocumentProcessor()
-                processor.ingest_documents()
-                
-                # Initialize embedding client and Chroma collection creator
-                embed_client= EmbeddingClient(**embed_config)
-                chroma_creator= ChromaCollectionCreator(processor, embed_client)
+                if service_url:
+                    # the PDFs are parsed by the service on submit
+                    uploaded_files= st.file_uploader("Choose your PDF files", type= ['pdf'], accept_multiple_files= True)
+                else:
+                    from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
+                    
+                    # Initialize the document processor to ingest PDFs
+                    processor= DocumentProcessor()
+                    processor.ingest_documents()
                 
                 # Inputs for quiz topic and number of questions
                 quiz_topic= st.text_input("Pls give the topic for the Quiz")
@@ -48,18 +115,56 @@ if __name__ == "__main__":
                 submitted= st.form_submit_button("Submit")
                 
                 # Upon submission, generate the quiz questions
-                if submitted:
+                if submitted and service_url:
+                    from tasks.Quiz_Service.quiz_service_client import QuizServiceClient
+                    
+                    client= QuizServiceClient(service_url)
+                    document_set= client.ingest(uploaded_files or [])["document_set"]
+                    client.index(document_set)
+                    st.write(f"Generating {questions} questions for topic {quiz_topic}")
+                    
+                    # the service grows the question bank itself once the quiz is done
+                    question_stream= client.iter_quiz(document_set, quiz_topic, questions)
+                    on_complete= None
+                    
+                elif submitted:
+                    from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator
+                    from tasks.Quiz_Algo.quiz_algo import QuizGenerator
+                    
+                    # Initialize embedding client and Chroma collection creator
+                    embed_client= get_embedding_client(**embed_config)
+                    chroma_creator= ChromaCollectionCreator(processor, embed_client, persist_directory= chroma_directory,
+                                                   backend= vector_backend, precision= vector_precision)
                     chroma_creator.create_chroma_collection()
                     
-                    if len(processor.pages) > 0:
+                    if processor.page_count > 0:
                         st.write(f"Generating {questions} questions for topic {quiz_topic}")
                         
-                    # Create a quiz generator to generate the quiz questions based on topic and Chroma collection
-                    generator = QuizGenerator(quiz_topic, questions, chroma_creator)
-                    question_bank = generator.generate_quiz()
+                    # Create a quiz generator to generate the quiz questions based on topic and Chroma collection,
+                    # questions already in the bank are served first and only the shortfall goes to the LLM
+                    question_store, pregenerator= get_question_bank(question_bank_path)
+                    generator = QuizGenerator(quiz_topic, questions, chroma_creator, question_store= question_store,
+                                              response_cache= get_response_cache(response_cache_path))
+                    question_stream= generator.iter_quiz()
+                    
+                    # the bank of this document set and topic is grown once the quiz is complete,
+                    # so the pre-generation does not compete with the quiz for the LLM quota
+                    on_complete= lambda: pregenerator.schedule(chroma_creator, quiz_topic)
+                
+                if submitted:
+                    # the quiz screen opens with the first question, the rest keep arriving in the background
+                    first_question= next(question_stream, None)
+                    if first_question is None:
+                        st.error("No questions could be generated!", icon= "🚨")
+                        st.stop()
+                    
+                    from tasks.Quiz_Manager.quiz_manager import QuizManager
+                    quiz_manager= QuizManager([first_question], expected_questions= questions)
+                    quiz_manager.follow(question_stream, on_complete= on_complete)
                     
                     # Store the generated quiz questions and set display flags in session state
-                    st.session_state["question_bank"]= question_bank
+                    st.session_state["quiz_manager"]= quiz_manager
+                    st.session_state["question_bank"]= quiz_manager.questions
                     st.session_state["display_quiz"]= True                    
                     st.session_state["question_index"] = 0
     
@@ -72,8 +177,10 @@ if __name__ == "__main__":
         with st.container():
             st.header("Generated Quiz Questions: ")
             
-            # Initialize QuizManager with the stored question bank
-            quiz_manager= QuizManager(st.session_state["question_bank"])
+            # the QuizManager created on submit, its question list grows while the quiz is generated
+            quiz_manager= st.session_state["quiz_manager"]
+            if not quiz_manager.is_complete() or quiz_manager.error is not None:
+                show_generation_progress(quiz_manager)
             
             # Form to display multiple-choice questions
             with st.form("MCQ"):
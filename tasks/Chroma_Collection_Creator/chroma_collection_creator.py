@@ -1,57 +1,437 @@
 import os
 
 # Creates a Chroma database collection for the vector enbeddings
-# 1 > separate the documents into chunks
+# 1 > separate the documents into chunks of headings and paragraphs within a token budget
 # 2 > create a chromaDB collection for the chunks
+# 3 > chunk ids are content hashes, so with a persist_directory the collection of a document
+#     set is reused on disk: only new chunks are embedded and stale chunks are deleted
+# 4 > top-k retrieval results are memoized per (collection version, query, k)
+# 5 > with backend="numpy" the collection is a NumpyVectorStore instead of a Chroma client, saved
+#     as a memory mapped matrix per document set under persist_directory, optionally searched as
+#     a float16 or int8 copy
+# 6 > a BM25 index of the same chunks answers keyword queries without an embedding call, retrieval fuses the
+#     lexical and vector rankings, or uses the lexical one alone when enough chunks contain every query word
+# 7 > pages are extracted, chunked, embedded and added to the collection in windows of chunks, so indexing
+#     starts before a large PDF is fully parsed and the corpus is never held as one list of chunks
+# 8 > with a persist_directory the chunk ids and BM25 term counts of every document are saved in a manifest,
+#     a document whose chunks are all still in the collection is neither parsed, chunked nor embedded again
+# 9 > every build records when its persisted collection was used, the least recently used collections beyond
+#     max_collections (document sets nobody uploaded for a while) are deleted from persist_directory, with the
+#     manifests of their documents that no kept collection holds
 
 import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 import streamlit as st
 sys.path.append(os.path.abspath('../../'))
 from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
 from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
+from tasks.Text_Chunker.text_chunker import StructuredChunker
+from tasks.Vector_Index.vector_index import NumpyVectorStore
+from tasks.Lexical_Index.lexical_index import BM25Index, fuse
+from tasks.Tracing.tracing import tracer
 
 from langchain_core.documents import Document
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import Chroma
 
+# chromadb and langchain_community are imported inside the methods
+# that use them, so that loading this module does not slow down the app start
 
-class ChromaCollectionCreator:
+
+_clients= {}
+_clients_lock= threading.Lock()
+
+
+def get_persistent_client(persist_directory):
+    """
+    Returns the Chroma client of a persist directory, opened once per process and shared by every session.
+    """
+    import chromadb
+    
+    path= os.path.abspath(persist_directory)
+    with _clients_lock:
+        if path not in _clients:
+            _clients[path]= chromadb.PersistentClient(path= path)
+        return _clients[path]
+
+
+class RetrievalCache:
+    """
+    A process wide LRU cache of similarity search results.
+
+    Entries are keyed by the collection version, so a rebuilt collection never serves stale results.
+    """
+    
+    def __init__(self, max_entries=1024):
+        self.max_entries= max_entries
+        self.hits= 0
+        self.misses= 0
+        self._entries= OrderedDict()
+        self._lock= threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
     
-    def __init__(self, processor, embed_model):
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key]= value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last= False)
+
+
+retrieval_cache= RetrievalCache()
+
+RETRIEVAL_MODES= ("vector", "hybrid", "lexical")
+
+
+def chunk_id(document) -> str:
+    """
+    Content address of a chunk: the hash of its source document plus the hash of its text.
+    """
+    digest= hashlib.sha256()
+    digest.update(document.metadata.get("doc_hash", "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(document.page_content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# bumped whenever a change of the chunker or of the index terms invalidates the saved manifests
+MANIFEST_VERSION= 1
+
+# persisted collections used within this many seconds are never deleted, another session may be reading them
+COLLECTION_MIN_IDLE= 3600
+
+_usage_lock= threading.Lock()
+
+
+def read_usage(usage_path) -> dict:
+    """
+    :param usage_path: JSON file written by stale_collections.
+    :return: {collection name: {"used": last use time, "doc_hashes": documents of the collection}},
+             empty when the file is missing or unreadable.
+    """
+    try:
+        with open(usage_path, encoding= "utf-8") as f:
+            usage= json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # files written before the documents were recorded only hold the last use time
+    return {
+        name: entry if isinstance(entry, dict) else {"used": entry, "doc_hashes": []}
+        for name, entry in usage.items()
+    }
+
+
+def stale_collections(usage_path, name, stored, max_collections, min_idle=COLLECTION_MIN_IDLE, doc_hashes=()) -> dict:
+    """
+    Records the use of a persisted collection and picks the collections to delete.
+
+    :param usage_path: JSON file of the last use time and documents of every collection, kept next to the collections.
+    :param name: The collection used now, never picked.
+    :param stored: Names of the collections found on disk, the ones never recorded count as the oldest.
+    :param max_collections: Number of collections kept.
+    :param doc_hashes: Documents of the collection used now.
+    :return: {name: doc hashes} of the least recently used collections beyond max_collections, idle for at least
+             min_idle seconds. They are forgotten by the usage file, the caller deletes them.
+    """
+    now= time.time()
+    with _usage_lock:
+        usage= read_usage(usage_path)
+        usage= {stored_name: usage.get(stored_name, {"used": 0.0, "doc_hashes": []}) for stored_name in stored}
+        usage[name]= {"used": now, "doc_hashes": sorted(doc_hashes)}
         
+        oldest= sorted(
+            (stored_name for stored_name in usage if stored_name != name), key= lambda stored_name: usage[stored_name]["used"]
+        )
+        stale= {
+            stored_name: usage[stored_name]["doc_hashes"]
+            for stored_name in oldest[:max(0, len(usage) - max_collections)]
+            if now - usage[stored_name]["used"] >= min_idle
+        }
+        for stored_name in stale:
+            del usage[stored_name]
+        
+        # written aside and renamed, a crash never leaves a truncated file
+        os.makedirs(os.path.dirname(usage_path), exist_ok= True)
+        with open(usage_path + ".tmp", "w", encoding= "utf-8") as f:
+            json.dump(usage, f)
+        os.replace(usage_path + ".tmp", usage_path)
+    return stale
+
+
+def document_set_name(doc_hashes) -> str:
+    """
+    Name of the collection holding a set of documents, independent of upload order.
+    """
+    digest= hashlib.sha256("".join(sorted(set(doc_hashes))).encode("utf-8")).hexdigest()
+    return f"quizzify_{digest[:40]}"
+
+
+class ChromaCollectionCreator:
+    
+    def __init__(self, processor, embed_model, persist_directory=None, chunker=None, backend="chroma",
+                 precision="float32", retrieval_mode="hybrid", candidates=20, window=256, max_collections=16):
+        """
+        :param persist_directory: Optional directory of a persistent Chroma store. When given, the collection
+                                  of a document set is kept on disk and shared by every session that uploads it.
+        :param chunker: Optional StructuredChunker, chunks default to 512 estimated tokens without overlap.
+        :param backend: "chroma" or "numpy", the in-process NumPy index suits collections of a few PDFs.
+        :param precision: "float32", "float16" or "int8" storage of the numpy backend's searched matrix,
+                          the top candidates are always rescored in float32.
+        :param retrieval_mode: "vector" (dense only), "hybrid" (BM25 and dense fused, BM25 alone when it covers
+                               the query) or "lexical" (BM25 only, never embeds the query).
+        :param candidates: Number of chunks taken from each ranking before fusion.
+        :param window: Number of chunks embedded and added to the collection at once.
+        :param max_collections: Number of collections kept in persist_directory, None keeps them all.
+        """
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector store backend: {backend}")
+        if backend == "chroma" and precision != "float32":
+            raise ValueError("Quantized storage needs the numpy backend")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
         self.processor= processor
         self.embed_model= embed_model
+        self.persist_directory= persist_directory
+        self.backend= backend
+        self.precision= precision
+        self.chunker= chunker or StructuredChunker()
+        self.retrieval_mode= retrieval_mode
+        self.candidates= candidates
+        self.window= window
+        self.max_collections= max_collections
+        self.collection_name= None
+        self.version= None
         self.db= None
+        self.lexical_index= None
+        
+    # yields windows (id -> Document) of chunks not seen before, while the pages are still being extracted,
+    # chunks keep source, doc_hash, page (first page), page_end and heading in their metadata
+    def iter_chunk_windows(self, seen, doc_hashes=None):
+        
+        chunks= self.chunker.iter_chunks(self.processor.iter_pages(doc_hashes= doc_hashes))
+        window= {}
+        tokens= 0
+        elapsed= 0.0
+        while True:
+            start= time.perf_counter()
+            document= next(chunks, None)
+            elapsed += time.perf_counter() - start
+            if document is None:
+                break
+            
+            # identical chunks share an id, only the first one is kept
+            id_= chunk_id(document)
+            if id_ in seen:
+                continue
+            seen.add(id_)
+            window[id_]= document
+            tokens += document.metadata.get("tokens", 0)
+            if len(window) >= self.window:
+                yield window
+                window= {}
+        if window:
+            yield window
+        
+        # includes waiting for the extraction of streamed pages, which is traced as ingestion too
+        tracer.record("chunking", elapsed, pages= self.processor.page_count, items= len(seen), tokens= tokens)
         
     def create_chroma_collection(self):
         
-        if len(self.processor.pages) == 0:
+        if self.processor.page_count == 0:
             st.error("No documents found!", icon= "🚨")
             return
         
+        self.collection_name= document_set_name(self.processor.files.keys())
         
-        text_splitter = CharacterTextSplitter(
-            separator="\n\n",
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            is_separator_regex=False
-        )
+        # embedding included, the embedding cache counts its hits and misses on this span
+        with tracer.span("collection_build", backend= self.backend) as span:
+            self.db= self.open_collection()
+            existing_ids= set(self.stored_ids())
+            lexical_index= BM25Index() if self.retrieval_mode != "vector" else None
+            
+            seen= set()
+            new_count= 0
+            reused_documents= 0
+            for doc_hash in self.processor.files:
+                # a document indexed before with the same chunker is not even parsed
+                manifest= self.load_manifest(doc_hash)
+                if manifest is not None and existing_ids.issuperset(manifest["ids"]):
+                    seen.update(manifest["ids"])
+                    if lexical_index is not None:
+                        lexical_index.add_counts(manifest["ids"], manifest["lengths"], manifest["counts"])
+                    reused_documents += 1
+                    continue
+                
+                document_index= BM25Index()
+                for window in self.iter_chunk_windows(seen, doc_hashes= {doc_hash}):
+                    new_ids= [id_ for id_ in window if id_ not in existing_ids]
+                    if new_ids:
+                        self.db.add_texts(
+                            texts= [window[id_].page_content for id_ in new_ids],
+                            metadatas= [window[id_].metadata for id_ in new_ids],
+                            ids= new_ids
+                        )
+                        new_count += len(new_ids)
+                    document_index.add(window.keys(), (document.page_content for document in window.values()))
+                
+                counts= document_index.export()
+                if lexical_index is not None:
+                    lexical_index.add_counts(counts["ids"], counts["lengths"], counts["counts"])
+                self.save_manifest(doc_hash, counts)
+            
+            stale_ids= [id_ for id_ in existing_ids if id_ not in seen]
+            if stale_ids:
+                self.db.delete(ids= stale_ids)
+            
+            directory= self.numpy_directory()
+            if directory and (new_count or stale_ids):
+                self.db.save(directory)
+            span["items"]= len(seen)
+            span["reused_documents"]= reused_documents
         
-        # Creating text chunks
-        text_chunks = [page.page_content for page in self.processor.pages]
-        texts = text_splitter.create_documents(text_chunks)
+        self.lexical_index= lexical_index
+        st.success(f"Successfully split pages to {len(seen)} documents!!", icon= "✅")
+        if existing_ids:
+            st.success(f"Indexed {new_count} new chunks, reused {len(seen) - new_count}", icon= "✅")
         
-        if texts is not None:
-            st.success(f"Successfully split pages to {len(texts)} documents!!", icon= "✅")
-            
-        self.db= Chroma.from_documents(documents= texts, embedding= self.embed_model.client)
+        # content addressed name plus chunk ids identify exactly what the collection holds
+        self.version= f"{self.collection_name}:{hashlib.sha256(''.join(sorted(seen)).encode('utf-8')).hexdigest()[:16]}"
         
         if self.db:
             st.success("Successfully created Chroma Collection!", icon="✅")
+            self.delete_stale_collections()
         
         else:
             st.error("Failed to create a Chroma Collection!!", icon= "🚨") 
+    
+    # the saved chunk ids and BM25 term counts of a document, None when missing or made by another chunker
+    def load_manifest(self, doc_hash):
+        
+        if not self.persist_directory:
+            return None
+        try:
+            with open(os.path.join(self.persist_directory, "manifests", f"{doc_hash}.json"), encoding= "utf-8") as f:
+                manifest= json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("chunker") != self.chunker_signature():
+            return None
+        return manifest
+    
+    def save_manifest(self, doc_hash, counts):
+        
+        if not self.persist_directory:
+            return
+        directory= os.path.join(self.persist_directory, "manifests")
+        os.makedirs(directory, exist_ok= True)
+        path= os.path.join(directory, f"{doc_hash}.json")
+        # written aside and renamed, a concurrent build never reads half a manifest
+        with open(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp", "w", encoding= "utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "chunker": self.chunker_signature(), **counts}, f)
+        os.replace(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp", path)
+    
+    def chunker_signature(self) -> list:
+        
+        return [self.chunker.max_tokens, self.chunker.min_tokens, self.chunker.overlap_tokens]
+    
+    # deletes the persisted collections of document sets that have not been used for the longest time
+    def delete_stale_collections(self) -> list:
+        
+        if not self.persist_directory or self.max_collections is None:
+            return []
+        
+        if self.backend == "numpy":
+            root= os.path.join(self.persist_directory, "numpy")
+            stored= [name for name in os.listdir(root) if name.startswith("quizzify_")] if os.path.isdir(root) else []
+        else:
+            client= get_persistent_client(self.persist_directory)
+            stored= [
+                getattr(collection, "name", collection) for collection in client.list_collections()
+            ]
+            stored= [name for name in stored if name.startswith("quizzify_")]
+        
+        usage_path= os.path.join(self.persist_directory, f"{self.backend}_usage.json")
+        stale= stale_collections(usage_path, self.collection_name, stored, self.max_collections,
+                                 doc_hashes= self.processor.files.keys())
+        for name in stale:
+            if self.backend == "numpy":
+                shutil.rmtree(os.path.join(root, name), ignore_errors= True)
+            else:
+                try:
+                    client.delete_collection(name)
+                except Exception:
+                    # already deleted by another process
+                    pass
+        
+        # manifests are shared by the collections of both backends, only those no kept collection uses are deleted
+        kept= set()
+        for backend in ("chroma", "numpy"):
+            for entry in read_usage(os.path.join(self.persist_directory, f"{backend}_usage.json")).values():
+                kept.update(entry["doc_hashes"])
+        for doc_hash in set().union(*stale.values()) - kept:
+            try:
+                os.remove(os.path.join(self.persist_directory, "manifests", f"{doc_hash}.json"))
+            except OSError:
+                pass
+        return list(stale)
+    
+    # saved copy of the NumPy index of the current document set, None when nothing is persisted
+    def numpy_directory(self):
+        
+        if self.backend != "numpy" or not self.persist_directory:
+            return None
+        return os.path.join(self.persist_directory, "numpy", self.collection_name)
+        
+    # opens the collection of the current document set, reopening its on-disk copy when persistent
+    def open_collection(self):
+        
+        if self.backend == "numpy":
+            directory= self.numpy_directory()
+            db= NumpyVectorStore.load(directory, self.embed_model.client, precision= self.precision) if directory else None
+            return db if db is not None else NumpyVectorStore(self.embed_model.client, precision= self.precision)
+        
+        from langchain_community.vectorstores import Chroma
+        
+        if self.persist_directory:
+            return Chroma(
+                collection_name= self.collection_name,
+                embedding_function= self.embed_model.client,
+                client= get_persistent_client(self.persist_directory)
+            )
+        return Chroma(collection_name= self.collection_name, embedding_function= self.embed_model.client)
+    
+    def stored_ids(self) -> list:
+        
+        if self.backend == "numpy":
+            return self.db.get_ids()
+        return self.db.get(include= [])["ids"]
+    
+    # the stored chunks of the given ids, in the given order
+    def documents_by_id(self, ids) -> list:
+        
+        if not ids:
+            return []
+        if self.backend == "numpy":
+            found= {document.id: document for document in self.db.get_by_ids(ids)}
+        else:
+            stored= self.db.get(ids= list(ids), include= ["documents", "metadatas"])
+            found= {
+                id_: Document(id= id_, page_content= text, metadata= metadata or {})
+                for id_, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+            }
+        return [found[id_] for id_ in ids if id_ in found]
         
     # to create a chroma collection for the user's query
     def query_chroma_collection(self, query)-> Document :
@@ -66,6 +446,54 @@ class ChromaCollectionCreator:
         else:
             st.error("Chroma Collection has not been created!", icon="🚨")
             
+    # top-k chunks for a query, memoized per collection version so repeated topics skip the vector query
+    def retrieve(self, query, k=4) -> list:
+        
+        if not self.db:
+            raise ValueError("Chroma Collection has not been created!")
+        
+        with tracer.span("retrieval") as span:
+            key= (self.version, self.retrieval_mode, query, k)
+            documents= retrieval_cache.get(key)
+            span["cache_hits"]= int(documents is not None)
+            if documents is None:
+                documents= self.search(query, k, span)
+                retrieval_cache.put(key, documents)
+        return documents
+    
+    # ranks the chunks for a query according to the retrieval mode, counting the path taken on the span
+    def search(self, query, k, span) -> list:
+        
+        if self.lexical_index is None:
+            return self.db.similarity_search(query, k= k)
+        
+        if self.retrieval_mode == "lexical" or self.lexical_index.covers(query, k):
+            span["lexical_only"]= 1
+            lexical= [id_ for id_, _ in self.lexical_index.search(query, k= k)]
+            if lexical or self.retrieval_mode == "lexical":
+                return self.documents_by_id(lexical)
+        
+        span["fused"]= 1
+        candidates= max(k, self.candidates)
+        lexical= [id_ for id_, _ in self.lexical_index.search(query, k= candidates)]
+        dense= {chunk_id(document): document for document in self.db.similarity_search(query, k= candidates)}
+        fused= fuse([lexical, list(dense)], k= k)
+        stored= {document.id: document for document in self.documents_by_id([id_ for id_ in fused if id_ not in dense])}
+        return [dense.get(id_) or stored[id_] for id_ in fused if id_ in dense or id_ in stored]
+    
+    # stored embeddings of retrieved chunks, row i belonging to documents[i], None when some are not in the collection
+    def chunk_vectors(self, documents):
+        
+        ids= [chunk_id(document) for document in documents]
+        try:
+            if self.backend == "numpy":
+                return self.db.get_vectors(ids)
+            stored= self.db.get(ids= ids, include= ["embeddings"])
+            vectors= dict(zip(stored["ids"], stored["embeddings"]))
+            return np.array([vectors[id_] for id_ in ids], dtype= np.float32)
+        except KeyError:
+            return None
+    
     def as_retriever(self):
         return self.db.as_retriever()   
 
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath('../../'))
+from tasks.Google_Auth.google_auth import authenticate
+
+
+# This file keeps one VertexAI client per configuration for the whole process
+# 1 > clients are keyed by model, project, location and generation parameters
+# 2 > every session and rerun asking for the same configuration gets the same instance, and
+#     with it the same authenticated transport and pooled connections
+# 3 > the VertexAI SDK is imported when the first client is created
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _client_key(kind, model_name, project, location, params):
+    return (kind, model_name, project, location, tuple(sorted(params.items())))
+
+
+def _get_or_create(key, factory):
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+
+def get_llm(model_name="gemini-1.5-pro", project=None, location=None, **params):
+    """
+    Returns the shared VertexAI LLM for a configuration, creating it on first use.
+
+    :param model_name: Name of the Gemini model.
+    :param project: Google Cloud project, None for the default project of the credentials.
+    :param location: Vertex AI region, None for the SDK default.
+    :param params: Generation parameters such as temperature and max_output_tokens.
+    """
+    def factory():
+        from langchain_google_vertexai import VertexAI
+        
+        authenticate()
+        options = {"project": project, "location": location}
+        return VertexAI(model_name= model_name, **{k: v for k, v in options.items() if v is not None}, **params)
+    
+    return _get_or_create(_client_key("llm", model_name, project, location, params), factory)
+
+
+def get_embeddings(model_name, project=None, location=None, **params):
+    """
+    Returns the shared VertexAIEmbeddings client for a configuration, creating it on first use.
+    """
+    def factory():
+        from langchain_google_vertexai import VertexAIEmbeddings
+        
+        authenticate()
+        options = {"project": project, "location": location}
+        return VertexAIEmbeddings(model_name= model_name, **{k: v for k, v in options.items() if v is not None}, **params)
+    
+    return _get_or_create(_client_key("embeddings", model_name, project, location, params), factory)
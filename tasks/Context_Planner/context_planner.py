@@ -0,0 +1,104 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath('../../'))
+
+from tasks.Vector_Index.vector_index import normalize_rows
+
+
+# This file plans the context of every question of a quiz before generation starts
+# 1 > a pool of chunks relevant to the topic is retrieved once, best first, with their stored embeddings
+# 2 > the pool is clustered with spherical k-means seeded by farthest point sampling from the best chunk,
+#     so the clusters are spread over the parts of the document that match the topic
+# 3 > every question slot gets its own cluster as context, slots are ordered by the rank of their best chunk,
+#     so two questions rarely see the same passage and duplicates are rare by construction
+
+
+def farthest_point_sampling(vectors, count, first=0) -> np.ndarray:
+    """
+    Picks count rows, each one the farthest (in cosine distance) from the rows picked before it.
+    :param vectors: Unit length rows.
+    :param first: The row picked first.
+    :return: Indices of the picked rows, stops early when only duplicates of picked rows are left.
+    """
+    if len(vectors) == 0 or count <= 0:
+        return np.empty(0, dtype=np.int64)
+    chosen = [first]
+    distances = 1.0 - vectors @ vectors[first]
+    distances[first] = 0.0
+    while len(chosen) < min(count, len(vectors)):
+        index = int(np.argmax(distances))
+        if distances[index] <= 1e-6:
+            break
+        chosen.append(index)
+        distances = np.minimum(distances, 1.0 - vectors @ vectors[index])
+        distances[chosen] = 0.0
+    return np.array(chosen, dtype=np.int64)
+
+
+def kmeans(vectors, count, iterations=20) -> np.ndarray:
+    """
+    Spherical k-means (cosine similarity to unit centroids) seeded by farthest point sampling from row 0.
+    :param vectors: Unit length rows.
+    :return: The cluster label of every row, labels are 0 .. (number of clusters - 1).
+    """
+    seeds = farthest_point_sampling(vectors, count)
+    if len(seeds) == 0:
+        return np.empty(0, dtype=np.int64)
+    centroids = vectors[seeds]
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # a cluster left without members keeps its centroid
+        empty = np.bincount(labels, minlength=len(centroids)) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    # drops the labels of empty clusters
+    return np.unique(labels, return_inverse=True)[1]
+
+
+class ContextPlanner:
+    """
+    Splits a ranked pool of chunks into one context per question slot.
+    """
+
+    def __init__(self, context_size=4, pool_factor=2, min_pool=12):
+        """
+        :param context_size: Maximum number of chunks in the context of one slot.
+        :param pool_factor: The pool holds pool_factor * context_size chunks per slot.
+        :param min_pool: Smallest pool retrieved, whatever the number of slots.
+        """
+        self.context_size = context_size
+        self.pool_factor = pool_factor
+        self.min_pool = min_pool
+
+    def pool_size(self, slots) -> int:
+        """
+        :return: Number of chunks to retrieve for the given number of slots.
+        """
+        return max(self.min_pool, slots * self.context_size * self.pool_factor)
+
+    def plan(self, documents, vectors, slots) -> list:
+        """
+        :param documents: The pool of chunks, best first.
+        :param vectors: Their embeddings, row i belonging to documents[i].
+        :param slots: Number of contexts wanted.
+        :return: Up to slots lists of chunks, each list best first, the slot holding the best chunk first.
+                 Fewer lists are returned when the pool has fewer distinct chunks than slots.
+        """
+        if len(documents) == 0 or slots <= 0:
+            return []
+        labels = kmeans(normalize_rows(vectors), slots)
+
+        clusters = {}
+        for rank, label in enumerate(labels):
+            clusters.setdefault(int(label), []).append(documents[rank])
+        # dict order is the order in which the clusters first appear in the ranking
+        return [members[:self.context_size] for members in clusters.values()]
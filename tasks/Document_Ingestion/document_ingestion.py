@@ -1,57 +1,393 @@
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict, deque
+import hashlib
+import io
+import multiprocessing
 import os
 import tempfile
+import threading
 import uuid
+import sys
+sys.path.append(os.path.abspath('../../'))
+from tasks.Tracing.tracing import tracer
 
 
 # This file creates a simple document processor. 
 # 1 > creates a form to accepts multiple PDF files using streamlit.
 # 2 > generates unique names for the submitted file/s to avoid clash.
 # 3 > processes them into multiple documents using PyPDFLoader  
+# 4 > in parallel mode, PDFs (and page ranges of large PDFs) are parsed across a process pool and merged
+#     back in upload order, the workers read the PDFs from temporary files instead of receiving their bytes
+# 5 > parsed pages are memoized per file content hash in a process wide cache, so Streamlit
+#     reruns (and other sessions uploading the same file) only parse files not seen before
+# 6 > every sync of the uploads is traced as the "ingestion" stage
+# 7 > PDFs of more than stream_min_pages pages are not parsed on upload nor cached, iter_pages() parses them
+#     window by window while the caller consumes the pages, so only a few windows are in memory at once
+
+
+# number of pages of a single PDF handled by one worker task
+PAGES_PER_TASK = 32
+
+# PDFs with more pages are streamed by iter_pages instead of being held in memory
+STREAM_MIN_PAGES = 500
+
+# start method of the worker processes, "forkserver" where available (POSIX), "spawn" elsewhere
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(max_workers=None):
+    """
+    Returns the process pool shared by every DocumentProcessor in this process.
+    The pool is created on first use so that importing this module stays cheap.
+    max_workers only sizes the pool when it is created, callers bound their own share of it
+    by the number of tasks they keep in flight.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # the app and the quiz service run threads (grpc clients, sqlite, locks), forking them can deadlock
+            # the workers, they are started from a clean forkserver process instead
+            _pool = ProcessPoolExecutor(max_workers= max_workers or os.cpu_count(),
+                                        mp_context= multiprocessing.get_context(START_METHOD))
+        return _pool
+
+
+def parse_pdf_pages(data, source, start=0, stop=None):
+    """
+    Extracts the text of the pages [start, stop) of a PDF held in memory.
+
+    Runs inside the worker processes, so it only takes and returns plain picklable values.
+
+    :param data: The raw bytes of the PDF file, or the path of a PDF on disk.
+    :param source: The file name recorded in the page metadata.
+    :return: A list of (page_text, metadata) tuples in page order.
+    """
+    reader = PdfReader(io.BytesIO(data) if isinstance(data, bytes) else data)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    
+    pages = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        pages.append((text, {"source": source, "page": page_number}))
+    return pages
+
+
+class IngestionCache:
+    """
+    A process wide LRU cache of parsed pages keyed by the content hash of the uploaded file.
+
+    The cache is bounded by the approximate memory held by the cached page texts,
+    the least recently used files are evicted first.
+    The page counts of files are remembered on the side, streamed files are counted once but never cached.
+    """
+    
+    def __init__(self, max_bytes=512 * 1024 * 1024, max_page_counts=4096):
+        """
+        :param max_bytes: Approximate upper bound of the memory used by cached pages.
+        :param max_page_counts: Number of page counts remembered.
+        """
+        self.max_bytes = max_bytes
+        self.max_page_counts = max_page_counts
+        self.size = 0
+        self._entries = OrderedDict()
+        self._page_counts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def estimate_size(pages):
+        return sum(len(page.page_content) + 64 for page in pages)
+    
+    def get(self, content_hash):
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                return None
+            self._entries.move_to_end(content_hash)
+            return entry[0]
+    
+    def put(self, content_hash, pages):
+        size = self.estimate_size(pages)
+        with self._lock:
+            if content_hash in self._entries:
+                self.size -= self._entries.pop(content_hash)[1]
+            self._entries[content_hash] = (pages, size)
+            self.size += size
+            
+            # the newest entry is always kept, even when it alone is over the bound
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+    
+    def get_page_count(self, content_hash):
+        with self._lock:
+            page_count = self._page_counts.get(content_hash)
+            if page_count is not None:
+                self._page_counts.move_to_end(content_hash)
+            return page_count
+    
+    def put_page_count(self, content_hash, page_count):
+        with self._lock:
+            self._page_counts[content_hash] = page_count
+            self._page_counts.move_to_end(content_hash)
+            while len(self._page_counts) > self.max_page_counts:
+                self._page_counts.popitem(last=False)
+    
+    def __contains__(self, content_hash):
+        with self._lock:
+            return content_hash in self._entries
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+# shared by every session served by this process
+ingestion_cache = IngestionCache()
+
+
+def hash_file_content(data):
+    return hashlib.sha256(data).hexdigest()
 
 
 class DocumentProcessor:
     
-    def __init__(self):
-        self.pages = []
+    def __init__(self, cache=None, stream_min_pages=STREAM_MIN_PAGES):
+        """
+        :param stream_min_pages: PDFs with more pages are parsed lazily by iter_pages, None never streams.
+        """
+        self.pages = [] # parsed pages of the files that are not streamed
+        self.files = OrderedDict() # content hash -> parsed pages of the currently uploaded files, None when streamed
+        self.streamed = {} # content hash -> (uploaded file, page count) of the streamed files
+        self.page_count = 0
+        self.stream_min_pages = stream_min_pages
+        self.cache = ingestion_cache if cache is None else cache
         
     # this method is responsible for document ingestion
-    def ingest_documents(self): 
+    def ingest_documents(self, parallel=True, max_workers=None): 
         uploaded_files= st.file_uploader("Choose your PDF files", type= ['pdf'], 
                                         accept_multiple_files= True)
         
         if uploaded_files is not None:
             
-            # creates unique name for the submited files
-            for uploaded_file in uploaded_files:
-                unique_id = uuid.uuid4().hex
-                original_name, file_extention = os.path.splitext(uploaded_file.name)
-                temp_file_name= f"{original_name}_{unique_id}{file_extention}"
-                temp_file_path= os.path.join(tempfile.gettempdir(), temp_file_name)    
-                
-                # print(temp_file_name,"/n")
-                # print(temp_file_path)
-                
-                with open(temp_file_path, 'wb') as f:
-                    f.write(uploaded_file.getvalue())
-                
-                #processing the files to docs
-                loader = PyPDFLoader(temp_file_path)
-                pages = loader.load_and_split() 
-                
-                self.pages.extend(pages) 
-                
-                os.unlink(temp_file_path)  
+            self.process_uploads(uploaded_files, parallel= parallel, max_workers= max_workers)
             
-            st.write(f"Total pages processed: {len(self.pages)}")
+            st.write(f"Total pages processed: {self.page_count}")
             #Uncomment to to check if the docs are as expected 
             # for i, page in enumerate(self.pages):
             #     st.write(f"Page {i+1} content:")
             #     st.write(page.page_content)
-
+    
+    # syncs self.pages with the given uploads, parsing only the files missing from the cache
+    def process_uploads(self, uploaded_files, parallel=True, max_workers=None):
+        
+        with tracer.span("ingestion", files= len(uploaded_files)) as span:
+            current= OrderedDict()
+            missing= OrderedDict()
+            page_counts= {}
+            streamed= {}
+            for uploaded_file in uploaded_files:
+                content_hash= hash_file_content(uploaded_file.getvalue())
+                if content_hash in current or content_hash in missing:
+                    continue
+                if content_hash in self.streamed:
+                    streamed[content_hash]= self.streamed[content_hash]
+                    current[content_hash]= None
+                    continue
+                pages= self.files.get(content_hash) or self.cache.get(content_hash)
+                if pages is None:
+                    # Streamlit reruns the script on every interaction, a streamed file is only counted once
+                    page_count= self.cache.get_page_count(content_hash)
+                    if page_count is None:
+                        page_count= self.count_pages(uploaded_file)
+                        self.cache.put_page_count(content_hash, page_count)
+                    if self.stream_min_pages is not None and page_count > self.stream_min_pages:
+                        streamed[content_hash]= (uploaded_file, page_count)
+                    else:
+                        missing[content_hash]= uploaded_file
+                        page_counts[content_hash]= page_count
+                current[content_hash]= pages
+            
+            if missing:
+                if parallel:
+                    parsed= self.parse_uploads(
+                        list(missing.values()), max_workers= max_workers, page_counts= list(page_counts.values())
+                    )
+                else:
+                    parsed= [self.parse_upload_with_loader(uploaded_file) for uploaded_file in missing.values()]
+                
+                for content_hash, pages in zip(missing, parsed):
+                    for page in pages:
+                        page.metadata["doc_hash"]= content_hash
+                    self.cache.put(content_hash, pages)
+                    current[content_hash]= pages
+            
+            # files that are no longer uploaded are dropped from the processor
+            self.files= current
+            self.streamed= streamed
+            self.pages= [page for pages in self.files.values() if pages is not None for page in pages]
+            self.page_count= len(self.pages) + sum(page_count for _, page_count in streamed.values())
+            
+            span["cache_hits"]= len(current) - len(missing) - len(streamed)
+            span["cache_misses"]= len(missing)
+            span["pages"]= len(self.pages)
+        return self.pages
+    
+    @staticmethod
+    def count_pages(uploaded_file):
+        try:
+            return len(PdfReader(io.BytesIO(uploaded_file.getvalue())).pages)
+        except Exception:
+            # left to the parser, which reports the broken file
+            return 0
+    
+    # yields the pages of every current file (or of the given ones) in upload order,
+    # streamed files are parsed while the caller consumes them
+    def iter_pages(self, max_workers=None, lookahead=None, doc_hashes=None):
+        
+        for content_hash, pages in self.files.items():
+            if doc_hashes is not None and content_hash not in doc_hashes:
+                continue
+            if pages is not None:
+                yield from pages
+            else:
+                uploaded_file, page_count= self.streamed[content_hash]
+                yield from self.stream_pdf_pages(uploaded_file, content_hash, page_count, max_workers, lookahead)
+    
+    # parses a PDF window by window across the process pool, keeping at most lookahead windows in flight,
+    # so page extraction runs ahead of the caller (chunking, embedding) without ever holding the whole document
+    def stream_pdf_pages(self, uploaded_file, content_hash, page_count, max_workers=None, lookahead=None):
+        
+        from langchain_core.documents import Document
+        
+        pool= get_process_pool(max_workers)
+        lookahead= lookahead or max_workers or 2 * (os.cpu_count() or 1)
+        
+        # the workers read the file themselves, a task only carries its path and page range
+        with tempfile.NamedTemporaryFile(suffix= ".pdf", delete= False) as f:
+            f.write(uploaded_file.getvalue())
+            path= f.name
+        
+        pending= deque()
+        starts= iter(range(0, page_count, PAGES_PER_TASK))
+        try:
+            while True:
+                for start in starts:
+                    pending.append(pool.submit(parse_pdf_pages, path, uploaded_file.name, start, start + PAGES_PER_TASK))
+                    if len(pending) >= lookahead:
+                        break
+                if not pending:
+                    break
+                
+                with tracer.span("ingestion") as span:
+                    result= pending.popleft().result()
+                    span["pages"]= len(result)
+                for text, metadata in result:
+                    yield Document(page_content= text, metadata= {**metadata, "doc_hash": content_hash})
+        finally:
+            for future in pending:
+                future.cancel()
+            os.unlink(path)
+    
+    # parses a single uploaded file through a temporary file and PyPDFLoader
+    def parse_upload_with_loader(self, uploaded_file):
+        
+        # creates unique name for the submited files
+        unique_id = uuid.uuid4().hex
+        original_name, file_extention = os.path.splitext(uploaded_file.name)
+        temp_file_name= f"{original_name}_{unique_id}{file_extention}"
+        temp_file_path= os.path.join(tempfile.gettempdir(), temp_file_name)    
+        
+        with open(temp_file_path, 'wb') as f:
+            f.write(uploaded_file.getvalue())
+        
+        from langchain_community.document_loaders import PyPDFLoader
+        
+        #processing the files to docs
+        try:
+            loader = PyPDFLoader(temp_file_path)
+            # whole pages, chunking is left to the structure aware chunker of the collection creator
+            pages = loader.load()
+        finally:
+            os.unlink(temp_file_path)  
+        
+        # the loader records the temporary path, pages and chunks name the uploaded file as in parallel mode
+        for page in pages:
+            page.metadata["source"]= uploaded_file.name
+        
+        return pages
+    
+    # parses many uploaded files across the shared process pool, keeping upload and page order
+    # returns one list of pages per uploaded file
+    def parse_uploads(self, uploaded_files, max_workers=None, page_counts=None):
+        """
+        :param page_counts: Page count of every uploaded file when already known, counted here otherwise.
+        :param max_workers: Maximum number of tasks of this call running at once.
+        """
+        
+        # langchain is imported on first parse so that showing the uploader stays fast
+        from langchain_core.documents import Document
+        
+        if page_counts is None:
+            page_counts= [self.count_pages(uploaded_file) for uploaded_file in uploaded_files]
+        
+        tasks= []
+        for file_index, (uploaded_file, page_count) in enumerate(zip(uploaded_files, page_counts)):
+            # a file that could not be counted still gets one task, so the parser reports it
+            for start in range(0, max(page_count, 1), PAGES_PER_TASK):
+                tasks.append((file_index, start, start + PAGES_PER_TASK if page_count else None))
+        
+        # a single small PDF is not worth the inter-process round trip
+        if len(tasks) <= 1:
+            results= [
+                parse_pdf_pages(uploaded_files[file_index].getvalue(), uploaded_files[file_index].name, start, stop)
+                for file_index, start, stop in tasks
+            ]
+        else:
+            results= self.run_tasks(uploaded_files, tasks, max_workers)
+        
+        documents= [[] for _ in uploaded_files]
+        for (file_index, _, _), result in zip(tasks, results):
+            documents[file_index].extend(
+                Document(page_content= text, metadata= metadata) for text, metadata in result
+            )
+        
+        # one Document per page, the same as PyPDFLoader.load() so both modes produce the same pages
+        return documents
+    
+    # runs the (file index, start, stop) tasks on the process pool, at most max_workers at once,
+    # every file is written once to a temporary file so that a task only carries its path and page range
+    def run_tasks(self, uploaded_files, tasks, max_workers=None):
+        
+        pool= get_process_pool(max_workers)
+        in_flight= max_workers or 2 * (os.cpu_count() or 1)
+        
+        paths= {}
+        pending= deque()
+        results= []
+        try:
+            for file_index in dict.fromkeys(file_index for file_index, _, _ in tasks):
+                with tempfile.NamedTemporaryFile(suffix= ".pdf", delete= False) as f:
+                    f.write(uploaded_files[file_index].getvalue())
+                    paths[file_index]= f.name
+            
+            for file_index, start, stop in tasks:
+                if len(pending) >= in_flight:
+                    results.append(pending.popleft().result())
+                pending.append(pool.submit(parse_pdf_pages, paths[file_index], uploaded_files[file_index].name, start, stop))
+            while pending:
+                results.append(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+            for path in paths.values():
+                os.unlink(path)
+        return results
 
 if __name__ == "__main__":
     processor = DocumentProcessor()
     processor.ingest_documents()
-        
\ No newline at end of file
+        
@@ -0,0 +1,200 @@
+import os
+import sys
+import sqlite3
+import hashlib
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+sys.path.append(os.path.abspath('../../'))
+from tasks.Tracing.tracing import tracer
+
+
+# This file creates a persistent, content-addressed cache for vector embeddings
+# 1 > every chunk is keyed by the embedding model name plus a hash of its text
+# 2 > vectors are stored as float32 blobs in a local SQLite database
+# 3 > the cache is size bounded, the least recently used vectors are evicted first
+
+
+class EmbeddingCache:
+    """
+    A disk backed LRU cache of embedding vectors.
+
+    Attributes:
+    - path: Location of the SQLite database file.
+    - max_entries: Maximum number of vectors kept before the least recently used ones are evicted.
+    - hits / misses: Counters of cache lookups served from disk and lookups that had to be embedded.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    _BATCH = 500
+
+    def __init__(self, path, max_entries=200_000):
+        """
+        :param path: Path of the SQLite file, its parent directory is created if needed.
+        :param max_entries: Maximum number of cached vectors.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name, text):
+        """
+        Builds the content address of a chunk for a given embedding model.
+
+        :param model_name: Name of the embedding model that produces the vector.
+        :param text: The chunk text.
+        :return: A hex digest identifying the (model, text) pair.
+        """
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """
+        Looks up the vectors of the given keys and refreshes their LRU position.
+
+        :param keys: An iterable of cache keys.
+        :return: A dictionary mapping every cached key to its float32 vector.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), self._BATCH):
+                batch = keys[start:start + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        # counted on the span of the stage that looked the vectors up (collection build, retrieval)
+        tracer.add("cache_hits", len(found))
+        tracer.add("cache_misses", len(keys) - len(found))
+        return found
+
+    def put_many(self, items):
+        """
+        Stores vectors in the cache and evicts the least recently used entries when over capacity.
+
+        :param items: An iterable of (key, vector) pairs.
+        """
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((key, array.shape[0], array.tobytes(), now))
+        if not rows:
+            return
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size += self._conn.total_changes - before
+
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+            self._conn.commit()
+
+    def stats(self):
+        """
+        :return: A dictionary with the hit/miss counters and the current number of cached vectors.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+    def __len__(self):
+        return self._size
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain embeddings client so that previously seen chunks are served from an EmbeddingCache.
+
+    The wrapper is itself a LangChain Embeddings object, so it can be handed to Chroma as the embedding function.
+    """
+
+    def __init__(self, embeddings, model_name, cache):
+        """
+        :param embeddings: The underlying embeddings client (e.g. VertexAIEmbeddings).
+        :param model_name: Name of the embedding model, part of every cache key.
+        :param cache: An EmbeddingCache instance.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # only the chunks missing from the cache are sent to the embedding model, once each
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), embedded))
+            self.cache.put_many(new_items)
+            for key, vector in new_items:
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        # queries are embedded with a different task type than documents, so they get their own key space
+        key = EmbeddingCache.make_key(f"{self.model_name}:query", text)
+        vectors = self.cache.get_many([key])
+        if key in vectors:
+            return vectors[key].tolist()
+
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many([(key, vector)])
+        return vector
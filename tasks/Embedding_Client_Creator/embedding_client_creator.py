@@ -1,26 +1,147 @@
-from langchain_google_vertexai import VertexAIEmbeddings
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+sys.path.append(os.path.abspath('../../'))
+from tasks.Embedding_Cache.embedding_cache import EmbeddingCache, CachedEmbeddings
+from tasks.Rate_Limiter.rate_limiter import call_with_backoff
+from tasks.Client_Registry.client_registry import get_embeddings
+from tasks.Tracing.tracing import tracer
+from tasks.Text_Chunker.text_chunker import count_tokens
 
 
 # This file creates the vector embeddings leveraging google cloud platform's VertexAI
+# 1 > documents are split into batches bounded by item count and estimated tokens
+# 2 > batches are embedded concurrently through a bounded thread pool, retrying on quota errors
+# 3 > when a cache_path is given, the client is wrapped by a persistent embedding cache so
+#     chunks that were embedded before are served from disk instead of calling VertexAI again
+
+
+def make_batches(texts, max_items=64, max_tokens=15_000):
+    """
+    Splits texts into consecutive batches that respect both the item and the token limit.
+
+    A single text larger than max_tokens gets a batch of its own.
+
+    :param texts: List of strings to embed.
+    :param max_items: Maximum number of texts per batch.
+    :param max_tokens: Maximum estimated tokens per batch.
+    :return: A list of (start, stop) index ranges into texts.
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for index, text in enumerate(texts):
+        text_tokens = count_tokens(text)
+        if index > start and (index - start >= max_items or tokens + text_tokens > max_tokens):
+            batches.append((start, index))
+            start = index
+            tokens = 0
+        tokens += text_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings backend so that large document lists are embedded in
+    size-bounded batches on a bounded thread pool, keeping the input order.
+    """
+
+    def __init__(self, embeddings, max_items=64, max_tokens=15_000, max_workers=4, max_retries=5):
+        """
+        :param embeddings: The backend embeddings client, anything with embed_documents / embed_query.
+        :param max_items: Maximum number of texts sent in one request.
+        :param max_tokens: Maximum estimated tokens sent in one request.
+        :param max_workers: Maximum number of requests in flight.
+        :param max_retries: Retries per batch when the quota is exhausted.
+        """
+        self.embeddings = embeddings
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+
+    def embed_array(self, texts) -> np.ndarray:
+        """
+        Embeds texts and returns the vectors as one contiguous float32 array, row i belonging to texts[i].
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batches = make_batches(texts, self.max_items, self.max_tokens)
+
+        def embed_batch(bounds):
+            start, stop = bounds
+            batch = texts[start:stop]
+            with tracer.span("embedding", items=len(batch), tokens=sum(map(count_tokens, batch))):
+                return call_with_backoff(self.embeddings.embed_documents, batch, max_retries=self.max_retries)
+
+        if len(batches) == 1 or self.max_workers <= 1:
+            return self._collect(len(texts), batches, map(embed_batch, batches))
+
+        with ThreadPoolExecutor(max_workers= min(self.max_workers, len(batches))) as executor:
+            # executor.map yields results in submission order, so rows line up with the input
+            return self._collect(len(texts), batches, executor.map(embed_batch, batches))
+
+    @staticmethod
+    def _collect(total, batches, results):
+        vectors = None
+        for (start, stop), batch_vectors in zip(batches, results):
+            batch_vectors = np.asarray(batch_vectors, dtype=np.float32)
+            if vectors is None:
+                vectors = np.empty((total, batch_vectors.shape[1]), dtype=np.float32)
+            vectors[start:stop] = batch_vectors
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        with tracer.span("query_embedding", tokens=count_tokens(text)):
+            return call_with_backoff(self.embeddings.embed_query, text, max_retries=self.max_retries)
+
 
 class EmbeddingClient:
     
-    def __init__(self, model_name, project, location):
-        self.client= VertexAIEmbeddings(
-            model_name= model_name,
-            project= project,
-            location= location
+    def __init__(self, model_name, project, location, cache_path=None, cache_max_entries=200_000,
+                 batch_max_items=64, batch_max_tokens=15_000, max_workers=4, backend=None):
+        """
+        :param backend: Optional embeddings backend used instead of VertexAIEmbeddings, e.g. a local fake for tests.
+        """
+        self.model_name= model_name
+        self.cache= None
+        if backend is None:
+            # shared by every EmbeddingClient of the process with the same configuration
+            backend= get_embeddings(model_name, project, location)
+        self.backend= backend
+        self.batched= BatchedEmbeddings(
+            backend,
+            max_items= batch_max_items,
+            max_tokens= batch_max_tokens,
+            max_workers= max_workers
         )
+        self.client= self.batched
+        
+        if cache_path:
+            self.cache= EmbeddingCache(cache_path, max_entries= cache_max_entries)
+            self.client= CachedEmbeddings(self.client, model_name, self.cache)
         
     # creates vector embedding for the user's query
     def embed_query(self, query):
         vectors= self.client.embed_query(query)
         return vectors
     
-    # creates vector embedding for the processed documents
+    # creates vector embeddings for the processed documents as a contiguous (n, dim) float32 array
     def embed_documents(self, documents):
         try:
-            self.client.embed_documents(documents)
+            if self.cache is None:
+                return self.batched.embed_array(documents)
+            return np.asarray(self.client.embed_documents(documents), dtype=np.float32)
         except AttributeError:
             print("Method embed_documents not defined for the client.")
             return None
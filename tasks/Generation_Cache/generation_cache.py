@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+
+
+# This file creates a persistent cache of LLM responses
+# 1 > responses are keyed by a fingerprint of the rendered prompt and the model parameters
+# 2 > entries expire after a TTL and the cache is size bounded, least recently used entries go first
+# 3 > optionally up to N response variants are kept per prompt and a random one is served,
+#     so regenerated quizzes keep some variety
+
+
+def prompt_fingerprint(prompt, model_params) -> str:
+    """
+    :param prompt: The rendered prompt text.
+    :param model_params: Dictionary of the parameters that change the output (model name, temperature, ...).
+    :return: A hex digest identifying the request.
+    """
+    payload = json.dumps({"prompt": prompt, "params": model_params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    A SQLite backed cache of LLM responses.
+
+    Attributes:
+    - ttl: Seconds a response stays valid.
+    - max_entries: Maximum number of stored responses.
+    - variants: Number of responses collected per prompt before they are served from the cache.
+    - hits / misses: Lookup counters.
+    """
+    
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=50_000, variants=1):
+        """
+        :param path: Path of the SQLite file, its parent directory is created if needed.
+        :param ttl: Time to live of a response in seconds.
+        :param max_entries: Maximum number of stored responses.
+        :param variants: With 1 a cached prompt always gets its cached response. With N > 1 the first N requests
+                         of a prompt go to the LLM and later ones get one of the N stored responses at random.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                fingerprint TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (fingerprint, variant)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+        self._conn.commit()
+    
+    def get(self, fingerprint):
+        """
+        :return: A cached response for the fingerprint, or None when the LLM should be called.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT variant, response FROM responses WHERE fingerprint = ? AND created > ?",
+                (fingerprint, now - self.ttl)
+            ).fetchall()
+            
+            if len(rows) < self.variants:
+                self.misses += 1
+                return None
+            
+            variant, response = random.choice(rows)
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE fingerprint = ? AND variant = ?",
+                (now, fingerprint, variant)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return response
+    
+    def put(self, fingerprint, response):
+        """
+        Stores a response as the next variant of the fingerprint and enforces the TTL and size bound.
+        """
+        now = time.time()
+        with self._lock:
+            # expired variants are dropped first so their slots are reused
+            self._conn.execute(
+                "DELETE FROM responses WHERE fingerprint = ? AND created <= ?", (fingerprint, now - self.ttl)
+            )
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM responses WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()[0]
+            if count >= self.variants:
+                return
+            
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (fingerprint, variant, response, created, last_access) "
+                "VALUES (?, (SELECT COALESCE(MAX(variant) + 1, 0) FROM responses WHERE fingerprint = ?), ?, ?, ?)",
+                (fingerprint, fingerprint, response, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+    
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE rowid IN "
+                "(SELECT rowid FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+    
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
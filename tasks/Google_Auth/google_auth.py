@@ -0,0 +1,45 @@
+import os
+import threading
+
+
+# This file resolves the Google Cloud credentials used by the VertexAI clients
+# 1 > points GOOGLE_APPLICATION_CREDENTIALS at the service account key when the key file exists
+# 2 > otherwise falls back to the application default credentials already configured
+# 3 > resolution runs once, on first use, and the result is cached for the life of the process
+
+# path of the service account key, can be overridden with QUIZZIFY_KEY_PATH
+key_path = os.environ.get("QUIZZIFY_KEY_PATH", "/Users/suryaae/Radical AI/GeminiQuizzify/auth_key.json")
+
+_credentials = None
+_lock = threading.Lock()
+
+
+def authenticate():
+    """
+    Resolves the Google credentials on first call and returns the cached result afterwards.
+
+    :return: A (credentials, project) tuple, (None, None) when no credentials could be found.
+    """
+    global _credentials
+    with _lock:
+        if _credentials is not None:
+            return _credentials
+
+        if os.path.exists(key_path):
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
+        elif "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ:
+            print(f"The file {key_path} does not exist, using application default credentials.")
+
+        from google.auth.exceptions import DefaultCredentialsError
+        import google.auth
+
+        try:
+            credentials, project = google.auth.default()
+            print(f"Authenticated with project: {project}")
+            _credentials = (credentials, project)
+        except DefaultCredentialsError as e:
+            # not cached, so a later call can pick up credentials configured in the meantime
+            print(f"Failed to authenticate: {e}")
+            return (None, None)
+
+        return _credentials
@@ -0,0 +1,206 @@
+import re
+import math
+import threading
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+
+# This file creates an in-memory BM25 inverted index over the chunks of a collection
+# 1 > chunks are tokenized into lowercased words without stopwords, plural "s" is stripped
+# 2 > every term keeps a posting list of (chunk position, BM25 term weight), the weights do not depend on
+#     the query and are computed once before the first search, so a query is a scatter-add of a few arrays
+# 3 > chunks can be added in windows while a collection is built, only compact term counts are kept per window
+# 4 > fuse() merges a lexical and a vector ranking with reciprocal rank fusion
+# 5 > covers() tells whether enough chunks contain every query term for the lexical ranking to be used alone
+# 6 > the term counts of an index can be exported and added to another index, so the counts of a document
+#     are saved with its collection and reused without reading or tokenizing its chunks again
+
+
+# words of casefolded text, shared with the prompt assembly
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are as at be because been before being below
+    between both but by can could did do does doing down during each few for from further had has have having
+    he her here hers him his how i if in into is it its itself just me more most my no nor not of off on once
+    only or other our ours out over own same she should so some such than that the their theirs them then
+    there these they this those through to too under until up very was we were what when where which while
+    who whom why will with would you your yours
+""".split())
+
+# constant of reciprocal rank fusion, damps the weight of the first few ranks
+RRF_K = 60
+
+
+def tokenize(text) -> list:
+    """
+    :return: The index terms of a text, in order and with repeats.
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text.casefold()):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def fuse(rankings, k=None, rrf_k=RRF_K) -> list:
+    """
+    Reciprocal rank fusion of several rankings of ids, best first.
+    :param rankings: Lists of ids, each best first.
+    :param k: Number of ids returned, all of them when None.
+    :return: The fused ranking of ids.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] += 1.0 / (rrf_k + rank + 1)
+    fused = sorted(scores, key=lambda id_: scores[id_], reverse=True)
+    return fused if k is None else fused[:k]
+
+
+class BM25Index:
+    """
+    A BM25 inverted index of chunk texts, searched without any embedding call.
+
+    Chunks are added with add(), the posting weights are (re)computed on the first search after an add.
+    """
+
+    def __init__(self, ids=(), texts=(), k1=1.5, b=0.75):
+        """
+        :param ids: Chunk ids, position i belongs to texts[i].
+        :param texts: Chunk texts.
+        :param k1: Term frequency saturation.
+        :param b: Strength of the document length normalization.
+        """
+        self.ids = []
+        self.k1 = k1
+        self.b = b
+        self._lengths = array("l")
+        self._counts = defaultdict(lambda: (array("l"), array("l"))) # term -> (chunk positions, term counts)
+        self._postings = None
+        self._lock = threading.Lock()
+        self.add(ids, texts)
+
+    def add(self, ids, texts):
+        """
+        Appends chunks to the index.
+        """
+        with self._lock:
+            for id_, text in zip(ids, texts):
+                position = len(self.ids)
+                self.ids.append(id_)
+                counts = Counter(tokenize(text))
+                self._lengths.append(sum(counts.values()))
+                for term, count in counts.items():
+                    positions, frequencies = self._counts[term]
+                    positions.append(position)
+                    frequencies.append(count)
+            self._postings = None
+
+    def add_counts(self, ids, lengths, counts):
+        """
+        Appends chunks already tokenized, in the format returned by export().
+        :param ids: Chunk ids.
+        :param lengths: Number of index terms of every chunk.
+        :param counts: term -> (chunk positions, term counts), positions counted from 0 in ids order.
+        """
+        with self._lock:
+            offset = len(self.ids)
+            self.ids.extend(ids)
+            self._lengths.extend(lengths)
+            for term, (positions, frequencies) in counts.items():
+                term_positions, term_frequencies = self._counts[term]
+                term_positions.extend(offset + position for position in positions)
+                term_frequencies.extend(frequencies)
+            self._postings = None
+
+    def export(self) -> dict:
+        """
+        :return: The "ids", "lengths" and term "counts" of the index as JSON serializable lists, see add_counts().
+        """
+        with self._lock:
+            return {
+                "ids": list(self.ids),
+                "lengths": self._lengths.tolist(),
+                "counts": {term: [positions.tolist(), frequencies.tolist()]
+                           for term, (positions, frequencies) in self._counts.items()}
+            }
+
+    def _weights(self) -> dict:
+        """
+        :return: term -> (chunk positions, BM25 weights), built once per set of chunks.
+        """
+        with self._lock:
+            if self._postings is not None:
+                return self._postings
+            lengths = np.array(self._lengths, dtype=np.float32)
+            average = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+            norms = self.k1 * (1 - self.b + self.b * lengths / average)
+            total = len(self.ids)
+            postings = {}
+            for term, (positions, counts) in self._counts.items():
+                positions = np.array(positions, dtype=np.int64)
+                frequencies = np.array(counts, dtype=np.float32)
+                idf = math.log(1 + (total - len(positions) + 0.5) / (len(positions) + 0.5))
+                weights = idf * frequencies * (self.k1 + 1) / (frequencies + norms[positions])
+                postings[term] = (positions, weights.astype(np.float32))
+            self._postings = postings
+            return postings
+
+    def __len__(self):
+        return len(self.ids)
+
+    def terms(self, query) -> list:
+        """
+        :return: The distinct index terms of a query that occur in at least one chunk.
+        """
+        postings = self._weights()
+        return [term for term in dict.fromkeys(tokenize(query)) if term in postings]
+
+    def scores(self, query) -> np.ndarray:
+        """
+        :return: The BM25 score of every chunk for the query.
+        """
+        postings = self._weights()
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in dict.fromkeys(tokenize(query)):
+            if term not in postings:
+                continue
+            positions, weights = postings[term]
+            scores[positions] += weights
+        return scores
+
+    def search(self, query, k=4) -> list:
+        """
+        :return: (chunk id, BM25 score) pairs of the k best chunks with a positive score, best first.
+        """
+        if k <= 0:
+            return []
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[position], float(scores[position])) for position in order]
+
+    def covers(self, query, k) -> bool:
+        """
+        True when every word of the query is indexed and at least k chunks contain all of them,
+        then the lexical ranking alone is trusted for the top k.
+        """
+        postings = self._weights()
+        terms = tokenize(query)
+        if not terms or any(term not in postings for term in terms):
+            return False
+        common = None
+        for term in dict.fromkeys(terms):
+            positions = postings[term][0]
+            common = positions if common is None else np.intersect1d(common, positions, assume_unique=True)
+            if len(common) < k:
+                return False
+        return True
@@ -0,0 +1,190 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath('../../'))
+
+from tasks.Text_Chunker.text_chunker import CHARS_PER_TOKEN, TOKENS_PER_WORD, count_tokens, split_sentences
+from tasks.Question_Dedup.question_dedup import normalize_question
+from tasks.Lexical_Index.lexical_index import STOPWORDS as LEXICAL_STOPWORDS, WORD_PATTERN
+
+
+# This file assembles the variable parts of a quiz prompt (context and previous questions) within a token budget
+# 1 > the retrieved chunks are cut into sentences, a sentence already seen in an earlier chunk (chunk overlap,
+#     the same passage in two documents) is dropped, the rest is kept in retrieval order up to the context budget
+# 2 > previous questions are ranked by the words they share with the topic and the context, recent ones first
+#     on ties, the best are kept in full and the next ones as keyword fingerprints until the budget is spent
+# 3 > whatever the context leaves unused goes to the previous questions, every assembly reports its token counts
+
+
+# the index stopwords plus the words every quiz question is made of
+STOPWORDS = LEXICAL_STOPWORDS | frozenset("""
+    many may much must one whether following correct true false statement best describes describe question
+    answer choice
+""".split())
+
+
+def content_words(text) -> set:
+    """
+    The lowercased words of a text, without stopwords and one or two letter words.
+    """
+    return {word for word in WORD_PATTERN.findall(text.casefold()) if len(word) > 2 and word not in STOPWORDS}
+
+
+def fingerprint(question, max_words=6) -> str:
+    """
+    The first max_words content words of a question in their original order,
+    e.g. "Which gas do plants absorb during photosynthesis?" -> "gas plants absorb photosynthesis".
+    """
+    words = []
+    for word in WORD_PATTERN.findall(question.casefold()):
+        if len(word) > 2 and word not in STOPWORDS and word not in words:
+            words.append(word)
+            if len(words) == max_words:
+                break
+    return " ".join(words)
+
+
+def truncate_to_tokens(text, max_tokens) -> str:
+    """
+    Cuts a text to at most max_tokens estimated tokens, at a sentence boundary when one is close enough.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept = []
+    used = 0
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    # a single long sentence is cut at a word boundary instead of being dropped, a single long word at max_tokens
+    if used < max_tokens // 2:
+        return " ".join(text.split()[:int(max_tokens / TOKENS_PER_WORD)])[:max_tokens * CHARS_PER_TOKEN]
+    return " ".join(kept)
+
+
+def compact_chunks(texts, max_tokens) -> tuple:
+    """
+    Deduplicates the sentences of the chunks and keeps them in order until max_tokens is spent.
+    :return: (kept chunk texts, stats dictionary with the tokens kept and the sentences dropped as duplicates
+             or over the budget)
+    """
+    seen = set()
+    kept = []
+    stats = {"context_tokens": 0, "duplicate_sentences": 0, "trimmed_tokens": 0}
+    budget = max_tokens
+    for text in texts:
+        sentences = []
+        for sentence in split_sentences(" ".join(text.split())):
+            key = normalize_question(sentence)
+            if not key:
+                continue
+            if key in seen:
+                stats["duplicate_sentences"] += 1
+                continue
+            seen.add(key)
+            sentences.append(sentence)
+
+        chunk = " ".join(sentences)
+        if not chunk:
+            continue
+        tokens = count_tokens(chunk)
+        if tokens > budget:
+            trimmed = truncate_to_tokens(chunk, budget) if budget > 0 else ""
+            stats["trimmed_tokens"] += tokens - count_tokens(trimmed)
+            chunk, tokens = trimmed, count_tokens(trimmed)
+        if chunk:
+            kept.append(chunk)
+            budget -= tokens
+            stats["context_tokens"] += tokens
+    return kept, stats
+
+
+def select_questions(questions, query, max_tokens, full_share=0.5, fingerprint_words=6) -> tuple:
+    """
+    Picks the previous questions most related to the query within max_tokens.
+
+    Questions are ranked by the content words they share with the query, the latest question first on ties.
+    The best are kept in full up to full_share of the budget, the next ones as fingerprints.
+    :param questions: Previous questions, oldest first.
+    :param query: The text the new question is generated from (topic and context).
+    :return: (full questions, fingerprints, stats dictionary)
+    """
+    query_words = content_words(query)
+    unique = {}
+    for position, question in enumerate(questions):
+        unique[normalize_question(question)] = (position, question)
+
+    ranked = sorted(
+        unique.values(),
+        key= lambda item: (len(content_words(item[1]) & query_words), item[0]),
+        reverse= True
+    )
+
+    full, fingerprints = [], []
+    full_budget = int(max_tokens * full_share)
+    used = 0
+    for _, question in ranked:
+        tokens = count_tokens(question)
+        if not fingerprints and used + tokens <= full_budget:
+            full.append(question)
+            used += tokens
+            continue
+        compact = fingerprint(question, fingerprint_words)
+        tokens = count_tokens(compact) + 1 # separator
+        if used + tokens > max_tokens:
+            break
+        fingerprints.append(compact)
+        used += tokens
+
+    stats = {
+        "question_tokens": used,
+        "full_questions": len(full),
+        "fingerprinted_questions": len(fingerprints),
+        "dropped_questions": len(questions) - len(full) - len(fingerprints)
+    }
+    return full, fingerprints, stats
+
+
+class PromptBudget:
+    """
+    Splits the tokens of a prompt between its template, the retrieved context and the previous questions.
+    """
+
+    def __init__(self, max_tokens=3000, context_share=0.7, full_share=0.5, fingerprint_words=6):
+        """
+        :param max_tokens: Estimated tokens of the whole rendered prompt.
+        :param context_share: Part of the tokens left by the template reserved for the context,
+                              the previous questions get the rest and whatever the context does not use.
+        :param full_share: Part of the question tokens spent on questions kept in full, the rest on fingerprints.
+        :param fingerprint_words: Content words per fingerprint.
+        """
+        self.max_tokens = max_tokens
+        self.context_share = context_share
+        self.full_share = full_share
+        self.fingerprint_words = fingerprint_words
+
+    def assemble(self, template_tokens, topic, chunks, questions) -> dict:
+        """
+        :param template_tokens: Tokens of the template rendered with an empty context and no previous questions.
+        :param chunks: Retrieved chunk texts, best first.
+        :param questions: Previous questions, oldest first.
+        :return: The "context" and "previous_questions" template values and a "stats" dictionary of token counts.
+        """
+        available = max(0, self.max_tokens - template_tokens)
+        kept, stats = compact_chunks(chunks, int(available * self.context_share))
+        context = "\n\n".join(kept)
+
+        full, fingerprints, question_stats = select_questions(
+            questions, f"{topic} {context}", available - stats["context_tokens"],
+            full_share= self.full_share, fingerprint_words= self.fingerprint_words
+        )
+        lines = list(full)
+        if fingerprints:
+            lines.append("Earlier questions (keywords only): " + "; ".join(fingerprints))
+
+        stats.update(question_stats)
+        stats["template_tokens"] = template_tokens
+        stats["prompt_tokens"] = template_tokens + stats["context_tokens"] + stats["question_tokens"]
+        return {"context": context, "previous_questions": "\n".join(lines), "stats": stats}
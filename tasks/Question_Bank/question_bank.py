@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.abspath('../../'))
+from tasks.Question_Dedup.question_dedup import QuestionDedupIndex, normalize_question
+from tasks.Tracing.tracing import tracer
+
+
+# This file stores reusable question banks and fills them in the background
+# 1 > QuestionBankStore: persistent questions indexed by document set and topic, in SQLite
+# 2 > BankPregenerator: a background worker pool that grows the bank of a (document set, topic)
+#     as soon as its collection is built, so later quizzes are served from the bank
+
+
+def bank_key(document_set, topic) -> str:
+    """
+    Key of a question bank: the collection name of the document set plus the normalized topic.
+    """
+    return f"{document_set}|{normalize_question(topic or '')}"
+
+
+class QuestionBankStore:
+    """
+    A SQLite store of generated questions, shared by every session of the process.
+    """
+    
+    def __init__(self, path):
+        """
+        :param path: Path of the SQLite file, its parent directory is created if needed.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS questions (
+                bank_key TEXT NOT NULL,
+                question_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (bank_key, question_hash)
+            )
+            """
+        )
+        self._conn.commit()
+    
+    def add_many(self, document_set, topic, questions) -> int:
+        """
+        Adds questions to a bank, questions identical after normalization are stored once.
+        
+        :return: The number of questions that were new.
+        """
+        key = bank_key(document_set, topic)
+        now = time.time()
+        rows = [
+            (key, hashlib.sha256(normalize_question(question['question']).encode("utf-8")).hexdigest(),
+             json.dumps(question), now)
+            for question in questions
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO questions (bank_key, question_hash, question, created) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+    
+    def get_all(self, document_set, topic) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question FROM questions WHERE bank_key = ? ORDER BY created",
+                (bank_key(document_set, topic),)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def sample(self, document_set, topic, count) -> list:
+        """
+        :return: Up to count questions of the bank, in random order.
+        """
+        questions = self.get_all(document_set, topic)
+        return random.sample(questions, min(count, len(questions)))
+    
+    def count(self, document_set, topic) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE bank_key = ?", (bank_key(document_set, topic),)
+            ).fetchone()[0]
+
+
+class BankPregenerator:
+    """
+    Grows question banks in the background.
+    
+    Work runs on a small thread pool: the generators share the vectorstore and the pooled LLM
+    client of the process, which cannot be handed to other processes, and the work is I/O bound.
+    Every LLM call goes through the same rate limiter as interactive quizzes.
+    """
+    
+    def __init__(self, store, target_size=30, max_workers=2, similarity_threshold=0.7):
+        """
+        :param store: The QuestionBankStore to fill.
+        :param target_size: Number of questions a bank is grown to.
+        :param max_workers: Number of banks generated at the same time.
+        :param similarity_threshold: Near-duplicate threshold applied across the whole bank.
+        """
+        self.store = store
+        self.target_size = target_size
+        self.similarity_threshold = similarity_threshold
+        self._executor = ThreadPoolExecutor(max_workers= max_workers, thread_name_prefix= "bank-pregenerator")
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def schedule(self, vectorstore, topic, generator_factory=None):
+        """
+        Starts growing the bank of the vectorstore's document set and topic, unless it is already full or in progress.
+        
+        :param vectorstore: A built ChromaCollectionCreator, its collection_name identifies the document set.
+        :param topic: The quiz topic.
+        :param generator_factory: Optional callable (topic, num_questions, vectorstore) -> QuizGenerator.
+        :return: The Future of the job, or None when nothing was scheduled.
+        """
+        document_set = getattr(vectorstore, "collection_name", None)
+        if not document_set or self.store.count(document_set, topic) >= self.target_size:
+            return None
+        
+        key = bank_key(document_set, topic)
+        with self._lock:
+            if key in self._pending and not self._pending[key].done():
+                return self._pending[key]
+            future = self._executor.submit(self._fill, vectorstore, document_set, topic, generator_factory)
+            future.add_done_callback(lambda done: self._report(key, done))
+            self._pending[key] = future
+            return future
+    
+    def _report(self, key, future):
+        # nobody waits on the futures of the app, a failed job would otherwise go unnoticed
+        if not future.cancelled() and future.exception() is not None:
+            error = future.exception()
+            print(f"Question bank generation failed for {key}: {type(error).__name__}: {error}")
+    
+    def _fill(self, vectorstore, document_set, topic, generator_factory):
+        # the job is traced as one "bank_pregeneration" call, a failure is counted as an error of the stage
+        with tracer.span("bank_pregeneration") as span:
+            span["questions"] = self._grow(vectorstore, document_set, topic, generator_factory)
+        return span["questions"]
+    
+    def _grow(self, vectorstore, document_set, topic, generator_factory):
+        from tasks.Quiz_Algo.quiz_algo import QuizGenerator
+        
+        factory = generator_factory or QuizGenerator
+        
+        dedup_index = QuestionDedupIndex(threshold= self.similarity_threshold)
+        existing = self.store.get_all(document_set, topic)
+        for question in existing:
+            dedup_index.add(question['question'])
+        
+        # stops after a round adds nothing, so a topic the document cannot cover does not loop forever
+        while len(dedup_index) < self.target_size:
+            generator = factory(topic, min(10, self.target_size - len(dedup_index)), vectorstore)
+            generator.prev_questions.extend(question['question'] for question in existing[-20:])
+            
+            new_questions = [
+                question for question in generator.generate_quiz()
+                if dedup_index.check_and_add(question['question'])
+            ]
+            if not new_questions:
+                break
+            self.store.add_many(document_set, topic, new_questions)
+            existing.extend(new_questions)
+        
+        return len(dedup_index)
+    
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait= wait)
@@ -0,0 +1,162 @@
+import re
+import zlib
+import threading
+
+import numpy as np
+
+
+# This file creates an index to detect near-duplicate quiz questions
+# 1 > questions are normalized (casefolded, punctuation and extra whitespace removed)
+# 2 > each question gets a MinHash signature of its character shingles
+# 3 > signatures are bucketed with locality sensitive hashing, so a lookup only compares
+#     against the few questions sharing a bucket instead of the whole bank
+
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_question(text) -> str:
+    """
+    Casefolds the text, drops punctuation and collapses whitespace.
+    """
+    text = re.sub(r"[^\w\s]", " ", text.casefold())
+    return " ".join(text.split())
+
+
+def shingles(text, size=4) -> set:
+    """
+    Character shingles of a normalized question, short questions give a single shingle.
+    """
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(first, second) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Picks the (bands, rows) split of the signature whose LSH threshold sits just below the similarity
+    threshold, so that candidates above the threshold are found with high probability.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold * 0.9:
+            best = (bands, rows)
+    return best
+
+
+class QuestionDedupIndex:
+    """
+    A MinHash / LSH index of question texts.
+
+    Attributes:
+    - threshold: Jaccard similarity of the shingle sets at or above which two questions are duplicates.
+    """
+
+    def __init__(self, threshold=0.7, num_perm=64, shingle_size=4, seed=1):
+        """
+        :param threshold: Similarity in [0, 1] above which a question counts as a duplicate, 1.0 only catches
+                          questions that are identical after normalization.
+        :param num_perm: Number of MinHash permutations in each signature.
+        :param shingle_size: Number of characters per shingle.
+        :param seed: Seed of the permutations, fixed so signatures are reproducible.
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._exact = set()
+        self._shingles = []
+        self._buckets = [dict() for _ in range(self.bands)]
+
+    def signature(self, shingle_set) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set),
+            dtype=np.uint64,
+            count=len(shingle_set)
+        )
+        # (a * x + b) mod p for every permutation and shingle, minimum over the shingles
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _find(self, normalized, shingle_set, signature):
+        if normalized in self._exact:
+            return True
+        if self.threshold >= 1.0:
+            return False
+
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        return any(jaccard(shingle_set, self._shingles[index]) >= self.threshold for index in candidates)
+
+    def _prepare(self, text):
+        normalized = normalize_question(text)
+        shingle_set = shingles(normalized, self.shingle_size)
+        return normalized, shingle_set, self.signature(shingle_set)
+
+    def is_duplicate(self, text) -> bool:
+        """
+        :param text: The question text.
+        :return: True when a question at least threshold similar is already indexed.
+        """
+        prepared = self._prepare(text)
+        with self._lock:
+            return self._find(*prepared)
+
+    def add(self, text):
+        """
+        Indexes a question.
+        """
+        prepared = self._prepare(text)
+        with self._lock:
+            self._insert(*prepared)
+
+    def check_and_add(self, text) -> bool:
+        """
+        Indexes the question unless it is a duplicate, atomically.
+
+        :return: True when the question was new and has been added.
+        """
+        prepared = self._prepare(text)
+        with self._lock:
+            if self._find(*prepared):
+                return False
+            self._insert(*prepared)
+            return True
+
+    def _insert(self, normalized, shingle_set, signature):
+        index = len(self._shingles)
+        self._exact.add(normalized)
+        self._shingles.append(shingle_set)
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(index)
+
+    def clear(self):
+        with self._lock:
+            self._exact.clear()
+            self._shingles.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def __len__(self):
+        return len(self._shingles)
@@ -0,0 +1,267 @@
+import re
+import json
+
+
+# This file extracts quiz questions from raw (possibly streamed) LLM output
+# 1 > scans the output incrementally and finds the first complete JSON value as soon as it closes,
+#     so a streamed response can be stopped early, brackets in the prose before it that do not hold
+#     a JSON object (or an array of objects) are skipped
+# 2 > repairs common problems: code fences, trailing commas, single quoted strings, python literals
+# 3 > checks every decoded question against the expected question structure
+
+
+class JsonStreamScanner:
+    """
+    Incrementally scans text for the first top-level JSON object or array.
+
+    Feed chunks of text as they arrive, feed() returns True once the value has closed.
+    A closed candidate that does not decode to an object or an array of objects, e.g. "[1]" or
+    "{see below}" in the prose before the answer, is dropped and the scan resumes right after it.
+    When the value is an array, the objects it contains are recorded as they close, so the
+    complete items of a truncated array can still be recovered.
+    """
+
+    def __init__(self):
+        self.text = []
+        self.length = 0
+        self.start = None
+        self.opener = None
+        self.end = None
+        self.depth = 0
+        self.quote = None
+        self.escape = False
+        self.item_start = None
+        self.items = []
+        self.last = ""
+
+    @property
+    def done(self) -> bool:
+        return self.end is not None
+
+    def feed(self, chunk) -> bool:
+        """
+        :param chunk: The next piece of text.
+        :return: True when the first top-level JSON value is complete.
+        """
+        if self.done:
+            return True
+
+        offset = self.length
+        self.text.append(chunk)
+        self.length += len(chunk)
+
+        for index, char in enumerate(chunk):
+            position = offset + index
+            previous, self.last = self.last, char
+            if self.quote:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == self.quote:
+                    self.quote = None
+                continue
+
+            if self.start is None:
+                if char in "{[":
+                    self.start = position
+                    self.opener = char
+                    self.depth = 1
+                continue
+
+            # an apostrophe inside a word ("don't") does not open a string
+            if char == '"' or (char == "'" and not previous.isalnum()):
+                self.quote = char
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 2 and char == "{" and self.opener == "[":
+                    self.item_start = position
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 1 and self.item_start is not None:
+                    self.items.append((self.item_start, position + 1))
+                    self.item_start = None
+                if self.depth == 0:
+                    if self._accept(position + 1):
+                        self.end = position + 1
+                        return True
+                    self.start = None
+                    self.item_start = None
+                    self.items = []
+        return False
+
+    def _accept(self, end) -> bool:
+        """
+        True when the candidate closing at end decodes to an object or to an array holding objects.
+        """
+        self.text = ["".join(self.text)]
+        value = loads_lenient(self.text[0][self.start:end])
+        if isinstance(value, list):
+            return not value or any(isinstance(item, dict) for item in value)
+        return isinstance(value, dict)
+
+    def value_text(self) -> str:
+        """
+        :return: The text of the JSON value found so far, complete or not.
+        """
+        if self.start is None:
+            return ""
+        full = "".join(self.text)
+        return full[self.start:self.end]
+
+    def result(self):
+        """
+        :return: The text of the complete JSON value, or None when it has not closed.
+        """
+        return self.value_text() if self.done else None
+
+    def item_texts(self) -> list:
+        """
+        :return: The texts of the complete objects found inside a top-level array.
+        """
+        full = "".join(self.text)
+        return [full[start:end] for start, end in self.items]
+
+
+def repair_json(text) -> str:
+    """
+    Rewrites almost-JSON into JSON: single quoted strings become double quoted, trailing commas
+    are dropped and python literals (True, False, None) are replaced by their JSON spelling.
+    """
+    output = []
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+
+        if char == '"':
+            end = index + 1
+            while end < length and text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            output.append(text[index:end + 1])
+            index = end + 1
+            continue
+
+        if char == "'":
+            end = index + 1
+            value = []
+            while end < length and text[end] != "'":
+                if text[end] == "\\" and end + 1 < length:
+                    value.append(text[end:end + 2] if text[end + 1] != "'" else "'")
+                    end += 2
+                    continue
+                value.append('\\"' if text[end] == '"' else text[end])
+                end += 1
+            output.append('"' + "".join(value) + '"')
+            index = end + 1
+            continue
+
+        if char == ",":
+            lookahead = index + 1
+            while lookahead < length and text[lookahead].isspace():
+                lookahead += 1
+            if lookahead < length and text[lookahead] in "}]":
+                index += 1
+                continue
+
+        literal = re.match(r"(True|False|None)\b", text[index:index + 6]) if char in "TFN" else None
+        if literal and (index == 0 or not text[index - 1].isalnum()):
+            output.append({"True": "true", "False": "false", "None": "null"}[literal.group(1)])
+            index += len(literal.group(1))
+            continue
+
+        output.append(char)
+        index += 1
+    return "".join(output)
+
+
+def loads_lenient(text):
+    """
+    Decodes JSON, falling back to the repaired text when the strict decode fails.
+
+    :return: The decoded value, or None when it cannot be decoded.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_json(text))
+    except json.JSONDecodeError:
+        return None
+
+
+def scan(source) -> JsonStreamScanner:
+    """
+    Runs the scanner over a string or an iterable of streamed chunks, stopping at the first complete value.
+    """
+    scanner = JsonStreamScanner()
+    chunks = [source] if isinstance(source, str) else source
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner
+
+
+def is_valid_question(question) -> bool:
+    """
+    Checks that a decoded item has the structure requested by the templates.
+    :param question: The decoded JSON item.
+    :return: Bool value
+    """
+    if not isinstance(question, dict):
+        return False
+    if not isinstance(question.get('question'), str) or not question['question'].strip():
+        return False
+    
+    choices = question.get('choices')
+    if not isinstance(choices, list) or len(choices) < 2:
+        return False
+    keys = set()
+    for choice in choices:
+        # a list or dict key would not even be hashable, the item is rejected and regenerated instead
+        if not isinstance(choice, dict) or not isinstance(choice.get('key'), str) or 'value' not in choice:
+            return False
+        keys.add(choice['key'])
+    
+    answer = question.get('answer')
+    return isinstance(answer, str) and answer in keys and isinstance(question.get('explanation'), str)
+
+
+def parse_question(source):
+    """
+    Extracts a single question from an LLM response.
+    :param source: The response text or an iterable of streamed chunks.
+    :return: The question dictionary, or None when no valid question could be extracted.
+    """
+    scanner = scan(source)
+    text = scanner.result()
+    if text is None:
+        return None
+    
+    question = loads_lenient(text)
+    # a single question wrapped in an array is accepted as well
+    if isinstance(question, list) and len(question) == 1:
+        question = question[0]
+    return question if is_valid_question(question) else None
+
+
+def parse_question_batch(source) -> list:
+    """
+    Extracts the structurally valid questions of a batch response.
+    
+    Invalid items are dropped one by one instead of discarding the whole response, and the
+    complete items of a truncated array are kept.
+    :param source: The response text or an iterable of streamed chunks.
+    :return: a list of JSON object
+    """
+    scanner = scan(source)
+    text = scanner.result()
+    
+    items = loads_lenient(text) if text is not None else None
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        items = [loads_lenient(item) for item in scanner.item_texts()]
+    
+    return [item for item in items if is_valid_question(item)]
@@ -1,43 +1,49 @@
 import streamlit as st
 import os
 import sys
-import json
 import time
-import re
+import queue
+import itertools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
         
 sys.path.append(os.path.abspath('../../'))
 
 from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
 from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
 from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator
+from tasks.Rate_Limiter.rate_limiter import TokenBucket
+from tasks.Question_Dedup.question_dedup import QuestionDedupIndex
+from tasks.Question_Parser.question_parser import JsonStreamScanner, parse_question, parse_question_batch
+from tasks.Client_Registry.client_registry import get_llm
+from tasks.Generation_Cache.generation_cache import prompt_fingerprint
+from tasks.Text_Chunker.text_chunker import count_tokens
+from tasks.Prompt_Context.prompt_context import PromptBudget
+from tasks.Context_Planner.context_planner import ContextPlanner
+from tasks.Tracing.tracing import tracer
 
 from langchain_core.prompts import PromptTemplate
-from langchain_google_vertexai import VertexAI
+from langchain_core.runnables import RunnableLambda
 
-# Run this file to check wheather the Google's api key is being authenticated as expected 
-key_path = "/Users/suryaae/Radical AI/GeminiQuizzify/auth_key.json"
-
-if os.path.exists(key_path):
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
-else:
-    raise FileNotFoundError(f"The file {key_path} does not exist.")
+# This file generates generates multiple-choice quiz questions with explanations.  
 
-from google.auth import credentials
-from google.auth.exceptions import DefaultCredentialsError
-import google.auth
 
-try:
-    credentials, project = google.auth.default()
-    print(f"Authenticated with project: {project}")
-except DefaultCredentialsError as e:
-    print(f"Failed to authenticate: {e}")
+# shared by every QuizGenerator in the process so that concurrent sessions respect one quota
+default_rate_limiter = TokenBucket(requests_per_minute= 60)
 
+# number of regenerations allowed when a question is a duplicate or cannot be decoded
+RETRY_LIMIT = 3
 
-# This file generates generates multiple-choice quiz questions with explanations.  
+# marks the end of the questions streamed by QuizGenerator.iter_quiz
+_END_OF_QUIZ = object()
 
 
 class QuizGenerator:
-    def __init__(self, topic=None, num_questions=1, vectorstore=None):
+    def __init__(self, topic=None, num_questions=1, vectorstore=None, llm=None,
+                 max_concurrency=4, rate_limiter=None, similarity_threshold=0.7, question_store=None,
+                 response_cache=None, prompt_budget=None):
         """
         # Initializes the QuizGenerator with a required topic, the number of questions for the quiz,
         # and an optional vectorstore for querying related information.
@@ -45,6 +51,13 @@ class QuizGenerator:
         # :param topic: A string representing the required topic of the quiz.
         # :param num_questions: An integer representing the number of questions to generate for the quiz, up to a maximum of 10.
         # :param vectorstore: An optional vectorstore instance (e.g., ChromaDB) to be used for querying information related to the quiz topic.
+        # :param llm: An optional LLM (or stub) used instead of the VertexAI model created by init_llm.
+        # :param max_concurrency: Maximum number of question requests in flight at once.
+        # :param rate_limiter: Optional TokenBucket pacing the LLM calls, defaults to the process wide one.
+        # :param similarity_threshold: Similarity (0-1) at or above which a question counts as a duplicate of one in the bank.
+        # :param question_store: Optional QuestionBankStore, questions are served from it first and new ones are saved to it.
+        # :param response_cache: Optional GenerationCache of LLM responses keyed by the rendered prompt.
+        # :param prompt_budget: Optional PromptBudget bounding the context and previous questions of every prompt.
         """
         if not topic:
             self.topic = "General Knowledge"
@@ -56,8 +69,29 @@ class QuizGenerator:
         self.num_questions = num_questions
 
         self.vectorstore = vectorstore
-        self.llm = None
+        self.question_store = question_store
+        self.response_cache = response_cache
+        self.prompt_budget = prompt_budget or PromptBudget()
+        self._local = threading.local() # per thread flag set when a retry must not be served from the cache
+        self._listeners = [] # callables notified of every accepted question, used by iter_quiz
+        self.llm = llm
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self._lock = threading.Lock()
+        
+        # retrieval fetches top_k chunks once per topic, each question gets a rotating window of context_size of them,
+        # unless the planner could give every question slot its own cluster of chunks (see plan_contexts)
+        self.top_k = 12
+        self.context_size = 4
+        self._context_slot = itertools.count()
+        self.planner = ContextPlanner(context_size= self.context_size, min_pool= self.top_k)
+        self._plans = []
+        self._retriever = None
+        self._chains = {}
+        self.timings = defaultdict(list) # stage name -> list of durations in seconds
+        
         self.question_bank = [] # Initialize the question bank to store questions
+        self.dedup_index = QuestionDedupIndex(threshold= similarity_threshold) # near-duplicate index over question_bank
         self.prev_questions = ["Who is the president of the US?"]
         self.system_template = """
             You are a subject matter expert on the topic: {topic}
@@ -85,10 +119,40 @@ class QuizGenerator:
                 "explanation": "<correct choice and explanation as to why the answer is correct>"
             }}
             
+            Context: {context}
+            """
+        # Used in batch mode, asks for {count} questions in a single call
+        self.batch_template = """
+            You are a subject matter expert on the topic: {topic}
+            
+            these are your previously generated questions: {previous_questions}
+            
+            Follow the instructions to create {count} quiz questions:
+            1. Generate {count} diverse questions based on the topic provided and context, each as key "question"
+            2. Each question should touch a different random subtopic of the given topic, no two questions may be the same or similar, and none may be similar to the previously generated questions.
+            3. Provide 4 multiple choice answers to each question as a list of key-value pairs "choices"
+            4. Provide the correct answer for each question from its list of answers as key "answer"
+            5. Provide an explanation as to why the answer is correct as key "explanation"
+                        
+            You must respond with only a JSON array of {count} objects with the following structure:
+            [
+                {{
+                    "question": "<question>",
+                    "choices": [
+                        {{"key": "A", "value": "<choice>"}},
+                        {{"key": "B", "value": "<choice>"}},
+                        {{"key": "C", "value": "<choice>"}},
+                        {{"key": "D", "value": "<choice>"}}
+                    ],
+                    "answer": "<answer key from choices list>",
+                    "explanation": "<correct choice and explanation as to why the answer is correct>"
+                }}
+            ]
+            
             Context: {context}
             """
     
-    def init_llm(self):
+    def init_llm(self, max_output_tokens=800):
         """
         Initializes and configures the Large Language Model (LLM) for generating quiz questions.
 
@@ -97,10 +161,11 @@ class QuizGenerator:
         
         :return: An instance or configuration for the LLM.
         """
-        self.llm = VertexAI(
+        # the client is shared by every generator of the process with the same configuration
+        self.llm = get_llm(
             model_name = "gemini-1.5-pro",
             temperature = 0.6, 
-            max_output_tokens = 800
+            max_output_tokens = max_output_tokens
         )
 
     def generate_question_with_vectorstore(self):
@@ -113,104 +178,456 @@ class QuizGenerator:
         if not self.vectorstore:
             raise ValueError("Vectorstore not provided.")
         
-        from langchain_core.runnables import RunnablePassthrough, RunnableParallel
-
-        retriever = self.vectorstore.as_retriever()
+        # Invoke the chain with the topic as input
+        response = self.build_chain(self.system_template).invoke(self.topic)
         
-        # Use the system template to create a PromptTemplate
-        prompt = PromptTemplate.from_template(self.system_template)
+        return response
+    
+    def generate_questions_batch_with_vectorstore(self, count):
+        """
+        Generates several quiz questions in a single LLM call using the batch template
+        :param count: The number of questions to ask for.
+        :return: The raw LLM response, expected to be a JSON array of questions.
+        """
+        if not self.llm:
+            self.init_llm()
+        if not self.vectorstore:
+            raise ValueError("Vectorstore not provided.")
         
-        def get_previous_questions(_):
-            return "\n".join(self.prev_questions)
+        # the output limit of the batch is passed with every call, the shared client may have been created with less
+        return self.build_chain(self.batch_template, max_output_tokens= min(8192, 800 * count),
+                                count= count).invoke(self.topic)
+    
+    def build_chain(self, template, max_output_tokens=None, **constants):
+        """
+        Returns the retrieval chain feeding the topic, retrieved context and previous questions into a template.
         
-        setup_and_retrieval = RunnableParallel(
-            {"context": retriever, 
-             "topic": RunnablePassthrough(),
-             "previous_questions": get_previous_questions}
-        )
-        # Create a chain with the Retriever, PromptTemplate, and LLM
-        chain = setup_and_retrieval | prompt | self.llm 
-
-        # Invoke the chain with the topic as input
-        response = chain.invoke(self.topic)
+        The context and previous questions are assembled within the prompt budget (see assemble_prompt).
+        The chain is compiled once per (template, max_output_tokens, constants) and reused for every later question.
+        :param template: The prompt template to use.
+        :param max_output_tokens: Output limit of every LLM call of the chain, None for the limit of the client.
+        :param constants: Additional fixed template variables.
+        :return: A runnable chain returning the LLM response.
+        """
+        key = (template, max_output_tokens, tuple(sorted(constants.items())))
+        chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+        
+        with self.timed("chain_build"):
+            # Use the system template to create a PromptTemplate
+            prompt = PromptTemplate.from_template(template)
+            
+            # the fixed part of the prompt, the rest of the budget is shared by the context and previous questions
+            template_tokens = count_tokens(template.format(topic= self.topic, context= "", previous_questions= "",
+                                                           **constants))
+            
+            def setup_and_retrieval(topic):
+                return {"topic": topic, **constants, **self.assemble_prompt(topic, template_tokens)}
+            
+            llm_params = {"max_output_tokens": max_output_tokens} if max_output_tokens is not None else {}
+            
+            # Create a chain with the Retriever, PromptTemplate, and LLM
+            chain = RunnableLambda(setup_and_retrieval) | prompt | RunnableLambda(
+                lambda prompt_value: self.call_llm(prompt_value, **llm_params))
         
+        self._chains[key] = chain
+        return chain
+    
+    def assemble_prompt(self, topic, template_tokens) -> dict:
+        """
+        Returns the context and previous questions of the next prompt, compacted to the prompt budget.
+        
+        Overlapping sentences of the retrieved chunks are dropped and the context is trimmed to its share of the budget,
+        the previous questions most related to the topic and context fill the rest, in full or as keyword fingerprints.
+        The token counts of every assembly are recorded on the "prompt" stage.
+        :param topic: The quiz topic used as the retrieval query.
+        :param template_tokens: Tokens of the template without context and previous questions.
+        :return: The "context" and "previous_questions" template values.
+        """
+        chunks = self.retrieve_chunks(topic)
+        with self._lock:
+            questions = list(self.prev_questions)
+        
+        with self.timed("prompt") as span:
+            assembled = self.prompt_budget.assemble(template_tokens, topic, chunks, questions)
+            span.update(assembled["stats"])
+        return {"context": assembled["context"], "previous_questions": assembled["previous_questions"]}
+    
+    def retrieve_chunks(self, topic) -> list:
+        """
+        Returns the chunk texts for the next question.
+        
+        The top_k chunks for the topic are memoized by the vectorstore, each call takes the next
+        window of context_size chunks so consecutive questions see different parts of the document.
+        :param topic: The quiz topic used as the retrieval query.
+        :return: The chunk texts, best first.
+        """
+        plans = self._plans
+        if plans:
+            # a batch call asks for all questions at once, it gets the best chunk of every planned context
+            if getattr(self._local, "spread", False):
+                documents = [plan[0] for plan in plans]
+            else:
+                documents = plans[next(self._context_slot) % len(plans)]
+            return [getattr(document, "page_content", str(document)) for document in documents]
+        
+        with self.timed("context"):
+            if hasattr(self.vectorstore, "retrieve"):
+                documents = self.vectorstore.retrieve(topic, k= self.top_k)
+            else:
+                if self._retriever is None:
+                    self._retriever = self.vectorstore.as_retriever()
+                retriever = self._retriever
+                documents = retriever.invoke(topic) if hasattr(retriever, "invoke") else retriever(topic)
+        
+        if not isinstance(documents, list):
+            return [str(documents)]
+        
+        if len(documents) > self.context_size:
+            start = (next(self._context_slot) * self.context_size) % len(documents)
+            documents = (documents + documents)[start:start + self.context_size]
+        
+        return [getattr(document, "page_content", str(document)) for document in documents]
+    
+    def call_llm(self, prompt, **llm_params):
+        """
+        Sends a rendered prompt to the LLM, paced by the rate limiter, and records the call duration.
+        
+        With a response cache, a prompt seen before (with the same model parameters) is answered from
+        the cache without using the quota, unless the current attempt is a retry. A fresh response is only
+        stored by cache_response, once the questions it holds have been accepted.
+        :param llm_params: Generation parameters of this call only, such as max_output_tokens.
+        """
+        prompt_text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        self._local.uncached = None
+        
+        # the whole request including rate limiting and retries, invoke_llm times every single attempt
+        with self.timed("llm_request", prompt_tokens= count_tokens(prompt_text)) as span:
+            fingerprint = None
+            if self.response_cache is not None:
+                fingerprint = prompt_fingerprint(prompt_text, self.model_params(**llm_params))
+                if not getattr(self._local, "bypass_cache", False):
+                    with self.timed("llm_cache"):
+                        response = self.response_cache.get(fingerprint)
+                    if response is not None:
+                        span["cache_hits"] = 1
+                        return response
+                    span["cache_misses"] = 1
+            
+            response = self.rate_limiter.call(self.invoke_llm, prompt, **llm_params)
+            span["response_tokens"] = count_tokens(str(response))
+        
+        if fingerprint is not None:
+            self._local.uncached = (fingerprint, response)
         return response
     
-    def generate_quiz(self) -> list:
+    def cache_response(self):
+        """
+        Stores the last fresh LLM response of this thread in the response cache, called once its questions were
+        parsed and validated so that a malformed or duplicate response is never served again.
+        """
+        uncached = getattr(self._local, "uncached", None)
+        self._local.uncached = None
+        if uncached is not None:
+            self.response_cache.put(*uncached)
+    
+    def invoke_llm(self, prompt, **llm_params):
+        """
+        Calls the LLM once.
+        
+        When the LLM supports streaming, the stream is stopped as soon as the first JSON value
+        of the response is complete, the remaining tokens are never generated or read.
+        :param llm_params: Generation parameters of this call, passed on to the LLM.
+        """
+        with self.timed("llm"):
+            if hasattr(self.llm, "stream"):
+                scanner = JsonStreamScanner()
+                stream = self.llm.stream(prompt, **llm_params)
+                try:
+                    for chunk in stream:
+                        if scanner.feed(chunk):
+                            break
+                finally:
+                    if hasattr(stream, "close"):
+                        stream.close()
+                if scanner.done:
+                    return scanner.result()
+                return "".join(scanner.text)
+            if hasattr(self.llm, "invoke"):
+                return self.llm.invoke(prompt, **llm_params)
+            # a plain callable has no generation parameters
+            return self.llm(prompt)
+    
+    def model_params(self, **llm_params) -> dict:
+        """
+        The LLM settings that change its output, part of the response cache key.
+        :param llm_params: Generation parameters of the call, they take precedence over those of the client.
+        """
+        return {
+            name: getattr(self.llm, name, None)
+            for name in ("model_name", "temperature", "max_output_tokens", "top_p", "top_k")
+        } | llm_params | {"llm": type(self.llm).__name__}
+    
+    @contextmanager
+    def timed(self, stage, **attributes):
+        """
+        Records the duration of the enclosed block under the given stage name, in timings and as a span of the tracer.
+        :return: The attributes of the span, counts added to it are exported with the stage.
+        """
+        start = time.perf_counter()
+        try:
+            with tracer.span(stage, **attributes) as span:
+                yield span
+        finally:
+            self.timings[stage].append(time.perf_counter() - start)
+    
+    def timing_report(self) -> dict:
+        """
+        Summarises the recorded stage durations
+        :return: A dictionary of stage name -> calls, total and mean seconds.
+        """
+        report = {}
+        for stage, durations in self.timings.items():
+            report[stage] = {
+                "calls": len(durations),
+                "total_s": round(sum(durations), 4),
+                "mean_s": round(sum(durations) / len(durations), 4)
+            }
+        return report
+    
+    def generate_quiz(self, batch=False) -> list:
         """
         This method generates the questions for the quiz
+        
+        Questions already in the question store for this document set and topic are served first,
+        the LLM is only called for the shortfall. Up to max_concurrency questions are requested at once,
+        paced by the rate limiter instead of a fixed delay between requests.
+        :param batch: When True, the shortfall is requested in a single call (see generate_quiz_batch).
         :return: a list of JSON object
         """
         
         self.question_bank = []
-        for _ in range(self.num_questions): 
-                           
-            question_str= self.generate_question_with_vectorstore()
-
-            # sometimes the json output generates " ```json|```" so this needs to be removed
-            cleaned_question_str = re.sub(r"```json|```", "", question_str).strip()
+        self.dedup_index.clear()
+        
+        self.serve_from_store()
+        served = len(self.question_bank)
+        self.plan_contexts(self.num_questions - served)
+        
+        if batch:
+            self.generate_missing_in_batches()
+        else:
+            self.generate_missing_concurrently()
+        
+        self.save_to_store(self.question_bank[served:])
+        return self.question_bank  
+    
+    def iter_quiz(self, batch=False):
+        """
+        Generates the quiz in a background thread and yields every validated question as soon as it is accepted.
+        
+        Questions served from the question store come first, then generated ones in the order they complete.
+        The generator finishes once generate_quiz has returned, its exception (if any) is raised to the caller.
+        :param batch: Same as for generate_quiz.
+        :return: A generator of JSON objects.
+        """
+        accepted = queue.Queue()
+        outcome = {}
+        
+        def run():
+            try:
+                self.generate_quiz(batch= batch)
+            except Exception as error:
+                outcome["error"] = error
+            finally:
+                accepted.put(_END_OF_QUIZ)
+        
+        self._listeners.append(accepted.put)
+        worker = threading.Thread(target= run, name= "quiz-generator", daemon= True)
+        worker.start()
+        try:
+            while True:
+                question = accepted.get()
+                if question is _END_OF_QUIZ:
+                    break
+                yield question
+        finally:
+            self._listeners.remove(accepted.put)
+        
+        worker.join()
+        if "error" in outcome:
+            raise outcome["error"]
+    
+    def plan_contexts(self, slots):
+        """
+        Gives each of the slots questions still to generate its own context before generation starts.
+        
+        A pool of chunks relevant to the topic is retrieved once and clustered on the embeddings stored in the
+        collection, every slot gets the best chunks of one cluster. Retries take the context of the next slot.
+        Without stored embeddings (a plain retriever as vectorstore) the rotating windows of top_k chunks are used.
+        :param slots: Number of questions to generate.
+        """
+        self._plans = []
+        if slots <= 0 or not hasattr(self.vectorstore, "chunk_vectors"):
+            return
+        
+        with self.timed("planning", slots= slots) as span:
+            documents = self.vectorstore.retrieve(self.topic, k= self.planner.pool_size(slots))
+            vectors = self.vectorstore.chunk_vectors(documents) if documents else None
+            if vectors is None:
+                return
+            plans = self.planner.plan(documents, vectors, slots)
+            span["pool"] = len(documents)
+            span["contexts"] = len(plans)
+            span["chunks"] = sum(len(plan) for plan in plans)
+        
+        self._context_slot = itertools.count()
+        self._plans = plans
+    
+    def generate_quiz_batch(self) -> list:
+        """
+        Generates the questions for the quiz in as few LLM calls as possible.
+        :return: a list of JSON object
+        """
+        return self.generate_quiz(batch= True)
+    
+    def document_set(self):
+        return getattr(self.vectorstore, "collection_name", None)
+    
+    def serve_from_store(self):
+        """
+        Adds stored questions of the (document set, topic) bank to the question bank, up to num_questions.
+        """
+        if self.question_store is None or not self.document_set():
+            return
+        
+        for question in self.question_store.sample(self.document_set(), self.topic, self.num_questions):
+            if self.validate_question(question):
+                self.add_question(question)
+        
+        print(f"Served {len(self.question_bank)} of {self.num_questions} questions from the question bank")
+    
+    def save_to_store(self, questions):
+        if self.question_store is not None and self.document_set() and questions:
+            self.question_store.add_many(self.document_set(), self.topic, questions)
+    
+    def generate_missing_concurrently(self):
+        """
+        Generates the questions missing from the question bank, up to max_concurrency at once
+        """
+        missing = self.num_questions - len(self.question_bank)
+        if missing <= 0:
+            return
+        if not self.llm:
+            self.init_llm()
+        
+        if self.max_concurrency == 1 or missing == 1:
+            for _ in range(missing):
+                self.generate_unique_question()
+        else:
+            workers = min(self.max_concurrency, missing)
+            with ThreadPoolExecutor(max_workers= workers) as executor:
+                list(executor.map(lambda _: self.generate_unique_question(), range(missing)))
+    
+    def generate_unique_question(self):
+        """
+        Generates one question and adds it to the question bank.
+        
+        If the question cannot be decoded or is a duplicate, it is regenerated up to RETRY_LIMIT times.
+        :return: The accepted question, or None when every attempt failed.
+        """
+        for attempt in range(1 + RETRY_LIMIT):
+            # a cached response that was rejected would be rejected again, retries go to the LLM
+            self._local.bypass_cache = attempt > 0
+            question_str = self.generate_question_with_vectorstore()
             
-            try: 
-               question= json.loads(cleaned_question_str)
+            # tolerates code fences, prose around the JSON and common syntax slips, then checks the structure
+            with self.timed("parse") as span:
+                question = parse_question(question_str)
+                span["failures"] = int(question is None)
             
-            except json.JSONDecodeError:
+            if question is None:
                 print("Failed to decode question JSON")
-                continue 
+                continue
             
             # Each generated question is validated in the question bank to check for duplicates
-            if self.validate_question(question):
-                print("Successfully generated unique question")
-                
-                self.question_bank.append(question)
-                self.prev_questions.append(question['question']) 
+            with self._lock:
+                accepted = self.validate_question(question)
+                if accepted:
+                    print("Successfully generated unique question")
+                    self.add_question(question)
+            if accepted:
+                self.cache_response()
+                return question
             
-            # if the dupilicate is deducted then model is made to regenerate questions for next 3 tries
-            else:
-                print("Duplicate or invalid question detected")
-                
-                for i in range(3): #Retry limit of 3 attempts
-                    question_str = self.generate_question_with_vectorstore()
-                    cleaned_question_str = re.sub(r"```json|```", "", question_str).strip()
-                    
-                    try:
-                        question = json.loads(cleaned_question_str)
-                    
-                    except json.JSONDecodeError:
-                        print("Failed to decode question JSON.")
-                        continue 
-                    
-                    if self.validate_question(question):
-                        print("Successfully generated unique question")
-                        self.question_bank.append(question)
-                        self.prev_questions.append(question['question']) 
-                        break
-                    
-                    else:
-                        print("Duplicate or invalid question detected")
-                        continue
+            print("Duplicate or invalid question detected")
+        
+        return None
+    
+    def generate_missing_in_batches(self):
+        """
+        Generates the questions missing from the question bank in as few LLM calls as possible.
+        
+        All missing questions are asked for in one call. Every item of the returned array is checked on its own,
+        and only the missing or invalid ones are requested again, up to RETRY_LIMIT more calls.
+        """
+        for attempt in range(1 + RETRY_LIMIT):
+            missing = self.num_questions - len(self.question_bank)
+            if missing <= 0:
+                break
             
-            # Time delay introduced to reduce request rate, preventing 429 ResourceExhausted error
-            time.sleep(10)
-                             
-        return self.question_bank  
+            self._local.bypass_cache = attempt > 0
+            self._local.spread = True
+            try:
+                response = self.generate_questions_batch_with_vectorstore(missing)
+            finally:
+                self._local.spread = False
+            
+            with self.timed("parse") as span:
+                questions = parse_question_batch(response)
+                span["items"] = len(questions)
+            
+            accepted = 0
+            for question in questions:
+                if len(self.question_bank) == self.num_questions:
+                    break
+                if self.validate_question(question):
+                    self.add_question(question)
+                    accepted += 1
+                else:
+                    print("Duplicate or invalid question detected")
+            
+            # only a response whose every requested question was accepted is worth serving again
+            if accepted == missing:
+                self.cache_response()
+            
+            print(f"Generated {len(self.question_bank)} of {self.num_questions} questions")
+    
+    def add_question(self, question: dict):
+        """
+        Adds a validated question to the question bank, the previous questions and the dedup index
+        """
+        self.question_bank.append(question)
+        self.prev_questions.append(question['question'])
+        self.dedup_index.add(question['question'])
+        for listener in self._listeners:
+            listener(question)
     
     def validate_question(self, question: dict) -> bool:
         """
-        This method checks for any duplicate questions from generated question bank
+        This method checks for any duplicate or near-duplicate questions from generated question bank
+        
+        Questions are compared after normalization through the MinHash index, so the check does not
+        scan the whole bank and rephrasings above similarity_threshold are caught as well.
         :return: Bool value
         """
         if 'question' not in question:
             raise ValueError("The provided dictionary must contain a 'question' key.")
 
-        question_text = question['question']
-        is_unique = True
-
-        for existing_question in self.question_bank:
-            if existing_question['question'] == question_text:
-                is_unique = False  
-                break
-            
-        return is_unique      
+        with self.timed("validate") as span:
+            unique = not self.dedup_index.is_duplicate(question['question'])
+            span["duplicates"] = int(not unique)
+        return unique      
     
 
 if __name__ == "__main__":
@@ -2,11 +2,8 @@ import streamlit as st
 import os 
 import sys
 import json
+import threading
 sys.path.append(os.path.abspath('../../'))
-from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
-from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
-from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator
-from tasks.Quiz_Algo.quiz_algo import QuizGenerator
 
 class QuizManager:
     """
@@ -14,20 +11,62 @@ class QuizManager:
     
     This class is responsible for storing a list of quiz questions, navigating between them, 
     and retrieving the current quiz question based on its index.
+    The list may still be growing while the rest of the quiz is generated in the background.
     
     Attributes:
     - questions: A list of dictionaries where each dictionary represents a quiz question.
-    - total_questions: The total number of questions in the quiz.
+    - total_questions: The number of questions available so far.
+    - expected_questions: The number of questions the quiz will have once generation is done.
+    - error: The exception that stopped the generation early, None otherwise.
     """
     
-    def __init__(self, questions: list):
+    def __init__(self, questions: list, expected_questions=None):
         """
         Initializes the QuizManager with a list of questions and calculates the total number of questions.
 
         :param questions: List of dictionaries where each dictionary contains the details of a quiz question.
+                          The same list object may keep receiving questions from follow().
+        :param expected_questions: Optional final size of the quiz, defaults to the current length of the list.
         """
         self.questions= questions
-        self.total_questions= len(self.questions)
+        self.expected_questions= expected_questions if expected_questions is not None else len(questions)
+        self.error= None
+    
+    @property
+    def total_questions(self):
+        return len(self.questions)
+    
+    def is_complete(self) -> bool:
+        """
+        :return: True once every expected question is in the list.
+        """
+        return self.total_questions >= self.expected_questions
+    
+    def follow(self, question_stream, on_complete=None):
+        """
+        Appends the questions of a stream (e.g. QuizGenerator.iter_quiz()) to the question list in a background thread.
+        
+        When the stream ends early the expected number of questions is lowered to what arrived,
+        an exception raised by the stream is kept in self.error so the app can show it.
+        :param question_stream: An iterator of quiz questions.
+        :param on_complete: Optional callable run after the stream has ended.
+        :return: The started thread.
+        """
+        def consume():
+            try:
+                for question in question_stream:
+                    self.questions.append(question)
+            except Exception as error:
+                print(f"Quiz generation failed: {error}")
+                self.error= error
+            finally:
+                self.expected_questions= len(self.questions)
+                if on_complete is not None:
+                    on_complete()
+        
+        thread= threading.Thread(target= consume, name= "quiz-follower", daemon= True)
+        thread.start()
+        return thread
         
     def get_question_at_index(self, index: int):
         """
@@ -63,6 +102,11 @@ if __name__ == "__main__":
     2. Generate quiz questions using the Chroma collection.
     3. Allow users to answer the generated quiz questions.
     """
+    # the pipeline is only needed by this demo, the quiz screen of the app only uses QuizManager
+    from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
+    from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
+    from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator
+    from tasks.Quiz_Algo.quiz_algo import QuizGenerator
     
     embed_config= {
         "model_name": "textembedding-gecko@003",
@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import uuid
+import time
+import base64
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.abspath('../../'))
+
+from tasks.Document_Ingestion.document_ingestion import DocumentProcessor
+from tasks.Embedding_Client_Creator.embedding_client_creator import EmbeddingClient
+from tasks.Chroma_Collection_Creator.chroma_collection_creator import ChromaCollectionCreator, document_set_name
+from tasks.Quiz_Algo.quiz_algo import QuizGenerator
+from tasks.Question_Bank.question_bank import QuestionBankStore, BankPregenerator
+from tasks.Generation_Cache.generation_cache import GenerationCache
+from tasks.Tracing.tracing import tracer
+
+
+# This file runs the quiz pipeline as a headless asyncio HTTP service
+# 1 > ingest, index and quiz jobs are queued and run by a pool of workers, the blocking pipeline
+#     calls run on a thread pool of the same size so the event loop keeps answering requests
+# 2 > clients poll GET /jobs/<id>, quiz jobs list their questions as soon as each one is accepted
+# 3 > ingested documents and built collections are kept per document set, so one upload serves
+#     any number of quizzes
+#
+#   python tasks/Quiz_Service/quiz_service.py --port 8765 --workers 8
+#
+# POST /jobs/ingest {"files": [{"name": "a.pdf", "data": "<base64>"}]}          -> {"document_set": ...}
+# POST /jobs/index  {"document_set": "..."}                                       -> {"collection": ..., "version": ...}
+# POST /jobs/quiz   {"document_set": "...", "topic": "...", "num_questions": n}   -> {"questions": [...]}
+# GET  /jobs/<id>, GET /health, GET /metrics (Prometheus text of the tracer)
+
+
+# largest accepted request body, PDFs are sent base64 encoded
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "quizzify")
+
+
+class Upload:
+    """
+    The uploaded file interface used by DocumentProcessor (name and getvalue()).
+    """
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+class Job:
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.questions = [] # quiz jobs only, grows while the quiz is generated
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self) -> dict:
+        job = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+        if self.kind == "quiz":
+            job["questions"] = list(self.questions)
+        return job
+
+
+class QuizService:
+    """
+    Runs ingest, index and quiz jobs over DocumentProcessor, ChromaCollectionCreator and QuizGenerator.
+    """
+
+    KINDS = ("ingest", "index", "quiz")
+
+    def __init__(self, embed_config, workers=4, max_jobs=1000, max_document_sets=64, cache_directory=CACHE_DIRECTORY,
+                 backend="numpy", precision="int8", llm=None):
+        """
+        :param embed_config: Keyword arguments of the shared EmbeddingClient.
+        :param workers: Number of jobs run at the same time.
+        :param max_jobs: Number of finished jobs kept for polling, the oldest are forgotten first.
+        :param max_document_sets: Number of ingested document sets kept in memory.
+        :param cache_directory: Directory of the vector store, question bank and response cache.
+        :param backend: Vector store backend of the collections, see ChromaCollectionCreator.
+        :param precision: Storage precision of the numpy backend.
+        :param llm: Optional LLM (or stub) used by every QuizGenerator instead of the pooled VertexAI client.
+        """
+        self.embed_client = EmbeddingClient(**embed_config)
+        self.llm = llm
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_document_sets = max_document_sets
+        self.persist_directory = os.path.join(cache_directory, "chroma")
+        self.backend = backend
+        self.precision = precision
+        self.question_store = QuestionBankStore(os.path.join(cache_directory, "question_bank.sqlite3"))
+        self.pregenerator = BankPregenerator(self.question_store)
+        self.response_cache = GenerationCache(os.path.join(cache_directory, "responses.sqlite3"), variants= 3)
+
+        self.jobs = OrderedDict()
+        self.processors = OrderedDict() # document set -> DocumentProcessor
+        self.collections = {} # document set -> ChromaCollectionCreator
+        self._building = {} # document set -> lock held while its collection is built
+        self._lock = threading.Lock()
+        self._queue = None
+        self._executor = ThreadPoolExecutor(max_workers= workers, thread_name_prefix= "quiz-service")
+
+    # job queue
+
+    def submit(self, kind, params) -> Job:
+        if kind not in self.KINDS:
+            raise KeyError(kind)
+        job = Job(kind, params)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        self._queue.put_nowait(job)
+        return job
+
+    def _forget_old_jobs(self):
+        # the oldest finished jobs go first, a long running job does not keep the ones after it from being forgotten
+        excess = len(self.jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:excess]:
+            del self.jobs[job_id]
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.result = await loop.run_in_executor(self._executor, getattr(self, f"run_{job.kind}"), job)
+                job.status = "done"
+            except Exception as error:
+                job.error = f"{type(error).__name__}: {error}"
+                job.status = "failed"
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+
+    # jobs, run on the thread pool
+
+    def run_ingest(self, job) -> dict:
+        files = job.params.get("files") or []
+        if not files:
+            raise ValueError("No files to ingest")
+        uploads = [Upload(file["name"], base64.b64decode(file["data"])) for file in files]
+
+        processor = DocumentProcessor()
+        processor.process_uploads(uploads)
+        document_set = document_set_name(processor.files.keys())
+        with self._lock:
+            self.processors[document_set] = processor
+            self.processors.move_to_end(document_set)
+            while len(self.processors) > self.max_document_sets:
+                forgotten, _ = self.processors.popitem(last= False)
+                self.collections.pop(forgotten, None)
+        return {"document_set": document_set, "files": len(processor.files), "pages": processor.page_count}
+
+    def run_index(self, job) -> dict:
+        creator = self.index(job.params["document_set"])
+        return {"collection": creator.collection_name, "version": creator.version}
+
+    def index(self, document_set) -> ChromaCollectionCreator:
+        """
+        Builds the collection of an ingested document set once, later calls return the same creator.
+
+        Concurrent calls for the same document set wait for the first one instead of building it again.
+        """
+        with self._lock:
+            creator = self.collections.get(document_set)
+            processor = self.processors.get(document_set)
+            building = self._building.setdefault(document_set, threading.Lock())
+        if creator is not None:
+            return creator
+        if processor is None:
+            raise KeyError(f"Unknown document set {document_set}, ingest it first")
+
+        with building:
+            with self._lock:
+                creator = self.collections.get(document_set)
+            if creator is not None:
+                return creator
+
+            creator = ChromaCollectionCreator(processor, self.embed_client, persist_directory= self.persist_directory,
+                                              backend= self.backend, precision= self.precision)
+            creator.create_chroma_collection()
+            if creator.db is None:
+                raise RuntimeError("Failed to create the collection")
+            with self._lock:
+                self._building.pop(document_set, None)
+                return self.collections.setdefault(document_set, creator)
+
+    def run_quiz(self, job) -> dict:
+        params = job.params
+        creator = self.index(params["document_set"])
+        topic = params.get("topic") or ""
+        generator = self._generator(topic, int(params.get("num_questions", 1)), creator,
+                                    question_store= self.question_store)
+
+        # pollers see every question as soon as it is accepted
+        for question in generator.iter_quiz(batch= bool(params.get("batch", False))):
+            job.questions.append(question)
+
+        self.pregenerator.schedule(creator, topic, generator_factory= self._generator)
+        return {"questions": len(job.questions), "timings": generator.timing_report()}
+
+    def _generator(self, topic, num_questions, creator, **kwargs) -> QuizGenerator:
+        return QuizGenerator(topic, num_questions, creator, llm= self.llm, response_cache= self.response_cache, **kwargs)
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            status, payload = await self.respond(reader)
+        except Exception as error:
+            status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}.get(status, "Error")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            return 400, {"error": "Malformed request"}
+        method, path = request_line[0], urlsplit(request_line[1]).path.rstrip("/")
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            return 413, {"error": "Request body too large"}
+        body = await reader.readexactly(length) if length else b""
+
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "queued": self._queue.qsize(), "workers": self.workers}
+        if method == "GET" and path == "/metrics":
+            return 200, tracer.to_prometheus()
+        if method == "GET" and path.startswith("/jobs/"):
+            job = self.jobs.get(path[len("/jobs/"):])
+            if job is None:
+                return 404, {"error": "Unknown job"}
+            return 200, job.to_dict()
+        if method == "POST" and path.startswith("/jobs/"):
+            try:
+                params = json.loads(body or b"{}")
+            except ValueError:
+                params = None
+            if not isinstance(params, dict):
+                return 400, {"error": "Body must be a JSON object"}
+            try:
+                job = self.submit(path[len("/jobs/"):], params)
+            except KeyError:
+                return 404, {"error": "Unknown job kind"}
+            return 202, job.to_dict()
+        return 404, {"error": "Not found"}
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        self._queue = asyncio.Queue()
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Quiz service listening on http://{host}:{port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in workers:
+                task.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description= "Headless quiz generation service")
+    parser.add_argument("--host", default= "127.0.0.1")
+    parser.add_argument("--port", type= int, default= 8765)
+    parser.add_argument("--workers", type= int, default= 4, help= "jobs run at the same time")
+    parser.add_argument("--model", default= "textembedding-gecko@003", help= "embedding model")
+    parser.add_argument("--project", default= "gemini-quizzify-21082024")
+    parser.add_argument("--location", default= "us-central1")
+    parser.add_argument("--cache-directory", default= CACHE_DIRECTORY)
+    args = parser.parse_args(argv)
+
+    embed_config = {
+        "model_name": args.model,
+        "project": args.project,
+        "location": args.location,
+        "cache_path": os.path.join(args.cache_directory, "embeddings.sqlite3")
+    }
+    service = QuizService(embed_config, workers= args.workers, cache_directory= args.cache_directory)
+    asyncio.run(service.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import json
+import time
+import base64
+import urllib.error
+import urllib.request
+
+
+# This file holds the client of the quiz service (see quiz_service.py), standard library only so
+# that the Streamlit app can hand all pipeline work to the service without importing the pipeline
+
+
+class QuizServiceError(RuntimeError):
+    pass
+
+
+class QuizServiceClient:
+
+    def __init__(self, base_url, timeout=30.0, poll_interval=0.25):
+        """
+        :param base_url: Address of the service, e.g. http://127.0.0.1:8765
+        :param timeout: Seconds allowed for a single HTTP request.
+        :param poll_interval: Seconds between two polls of a running job.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def request(self, method, path, payload=None) -> dict:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(f"{self.base_url}{path}", data= data, method= method,
+                                         headers= {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout= self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise QuizServiceError(f"{method} {path} failed with {error.code}: {error.read().decode('utf-8', 'replace')}")
+
+    def submit(self, kind, payload) -> str:
+        """
+        :return: The id of the queued job.
+        """
+        return self.request("POST", f"/jobs/{kind}", payload)["id"]
+
+    def job(self, job_id) -> dict:
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def wait(self, job_id, timeout=600.0) -> dict:
+        """
+        Polls a job until it is done.
+        :return: The result of the job.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.job(job_id)
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "failed":
+                raise QuizServiceError(job["error"])
+            if time.monotonic() > deadline:
+                raise QuizServiceError(f"Job {job_id} did not finish within {timeout} seconds")
+            time.sleep(self.poll_interval)
+
+    def ingest(self, uploaded_files) -> dict:
+        """
+        :param uploaded_files: Objects with name and getvalue(), e.g. streamlit UploadedFiles.
+        :return: The ingest result, its "document_set" names the documents in later jobs.
+        """
+        files = [
+            {"name": uploaded_file.name, "data": base64.b64encode(uploaded_file.getvalue()).decode("ascii")}
+            for uploaded_file in uploaded_files
+        ]
+        return self.wait(self.submit("ingest", {"files": files}))
+
+    def index(self, document_set) -> dict:
+        return self.wait(self.submit("index", {"document_set": document_set}))
+
+    def iter_quiz(self, document_set, topic, num_questions, batch=False, timeout=600.0):
+        """
+        Submits a quiz job and yields its questions while they are generated.
+        """
+        job_id = self.submit("quiz", {"document_set": document_set, "topic": topic,
+                                      "num_questions": num_questions, "batch": batch})
+        deadline = time.monotonic() + timeout
+        delivered = 0
+        while True:
+            job = self.job(job_id)
+            questions = job.get("questions") or []
+            yield from questions[delivered:]
+            delivered = len(questions)
+            if job["status"] == "done":
+                return
+            if job["status"] == "failed":
+                raise QuizServiceError(job["error"])
+            if time.monotonic() > deadline:
+                raise QuizServiceError(f"Quiz job {job_id} did not finish within {timeout} seconds")
+            time.sleep(self.poll_interval)
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import random
+import threading
+sys.path.append(os.path.abspath('../../'))
+from tasks.Tracing.tracing import tracer
+
+
+# This file holds the helpers used to stay within the Vertex AI quota
+# 1 > detects quota / rate limit errors (429 ResourceExhausted)
+# 2 > retries a call with exponential backoff and jitter when the quota is exhausted
+# 3 > paces concurrent requests with an adaptive token bucket
+# 4 > every retry is counted on the tracing span the call runs in
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+    _QUOTA_ERRORS = (ResourceExhausted, TooManyRequests)
+except ImportError:
+    _QUOTA_ERRORS = ()
+
+
+def is_quota_error(error) -> bool:
+    """
+    Checks whether an exception was raised because the request rate or quota was exceeded.
+
+    Only the exception type or its status code are trusted, the message may hold "429" for unrelated reasons
+    (a timeout after 429 ms, an id).
+
+    :param error: The exception raised by the client.
+    :return: True for 429 / ResourceExhausted errors.
+    """
+    if _QUOTA_ERRORS and isinstance(error, _QUOTA_ERRORS):
+        return True
+    for attribute in ("code", "status_code"):
+        code = getattr(error, attribute, None)
+        if callable(code):
+            # grpc errors expose code() returning a StatusCode
+            try:
+                code = code()
+            except Exception:
+                continue
+        if code == 429 or getattr(code, "name", None) == "RESOURCE_EXHAUSTED":
+            return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def call_with_backoff(func, *args, max_retries=5, base_delay=1.0, max_delay=60.0, **kwargs):
+    """
+    Calls func and retries it with exponential backoff while it fails with a quota error.
+
+    Any other exception is raised immediately.
+
+    :param func: The callable to invoke.
+    :param max_retries: Number of retries after the first attempt.
+    :param base_delay: Delay in seconds before the first retry, doubled on each further retry.
+    :param max_delay: Upper bound of a single delay in seconds.
+    :return: The return value of func.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            if attempt == max_retries or not is_quota_error(error):
+                raise
+            tracer.add("retries")
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket that paces requests to a requests-per-minute quota.
+
+    The refill rate adapts to the service: it is halved whenever a quota error comes back
+    and recovers additively on every successful request, up to the configured rate.
+    """
+
+    def __init__(self, requests_per_minute=60, burst=None, min_requests_per_minute=1):
+        """
+        :param requests_per_minute: The quota the bucket is sized to, also the maximum refill rate.
+        :param burst: Maximum number of tokens that can accumulate, defaults to a tenth of the per minute quota.
+        :param min_requests_per_minute: Lower bound of the refill rate after repeated quota errors.
+        """
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = min_requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst if burst is not None else max(1, requests_per_minute // 10)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until a token is available and takes it.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self):
+        """
+        Halves the refill rate and drains the bucket after a quota error.
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def reward(self):
+        """
+        Recovers the refill rate by 5% of the quota after a successful request.
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def call(self, func, *args, max_retries=5, **kwargs):
+        """
+        Calls func once a token is available, backing off and slowing the bucket down on quota errors.
+
+        :param func: The callable to invoke.
+        :param max_retries: Retries after the first attempt when the quota is exhausted.
+        :return: The return value of func.
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                if attempt == max_retries or not is_quota_error(error):
+                    raise
+                tracer.add("retries")
+                self.penalize()
+                time.sleep(min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+                continue
+            self.reward()
+            return result
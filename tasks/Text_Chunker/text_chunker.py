@@ -0,0 +1,289 @@
+import re
+import math
+from collections import deque
+
+from langchain_core.documents import Document
+
+
+# This file creates a structure aware, token budgeted chunker
+# 1 > pages of a document are read as one stream, so chunks can span page breaks
+# 2 > the text is cut into headings and paragraphs (sentences for over-long paragraphs)
+# 3 > blocks are packed greedily into chunks of at most max_tokens, a heading starts a new chunk
+#     once the running one holds min_tokens, and always stays attached to the text that follows it
+# 4 > every chunk keeps its source, doc_hash, first/last page and section heading
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|[IVXLC]+\.|chapter|section|part|unit|lecture|appendix)\b", re.IGNORECASE)
+
+# subword tokenizers produce roughly 1.3 tokens per whitespace separated word of english text
+TOKENS_PER_WORD = 1.3
+
+# and never fewer than one token per 4 characters, whatever the spacing (urls, tables, text without spaces)
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text) -> int:
+    """
+    Estimates the number of embedding model tokens of a text, shared by the chunker, the prompt budget
+    and the embedding batches.
+    """
+    return math.ceil(max(len(text.split()) * TOKENS_PER_WORD, len(text) / CHARS_PER_TOKEN))
+
+
+def split_sentences(text) -> list:
+    """
+    Splits a paragraph after sentence ending punctuation followed by a capitalized word or number.
+    """
+    return _SENTENCE_END.split(text)
+
+
+def is_heading(line) -> bool:
+    """
+    Heuristic for section titles in extracted PDF text: short lines without closing punctuation
+    that are numbered, upper case or title case.
+    """
+    line = line.strip()
+    if not line or len(line) > 80 or line[-1] in ".,;:!?":
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    words = re.findall(r"[A-Za-z][A-Za-z'-]*", line)
+    if not words or len(words) > 12:
+        return False
+    if line.isupper():
+        return True
+    capitalized = sum(1 for word in words if word[0].isupper() or len(word) <= 3)
+    return capitalized == len(words) and words[0][0].isupper()
+
+
+def iter_blocks(text):
+    """
+    Splits the text of a page into ("heading" | "paragraph", text) blocks.
+
+    Paragraphs are separated by blank lines, the line breaks inside a paragraph are joined and
+    words hyphenated across lines are rejoined.
+    """
+    for raw_block in re.split(r"\n\s*\n", text):
+        lines = [line.strip() for line in raw_block.split("\n") if line.strip()]
+        paragraph = []
+        for line in lines:
+            if is_heading(line):
+                if paragraph:
+                    yield "paragraph", _join_lines(paragraph)
+                    paragraph = []
+                yield "heading", line
+            else:
+                paragraph.append(line)
+        if paragraph:
+            yield "paragraph", _join_lines(paragraph)
+
+
+def _join_lines(lines):
+    parts = [lines[0]]
+    for line in lines[1:]:
+        # rejoins words hyphenated across a line break
+        if parts[-1].endswith("-") and line[0].islower():
+            parts[-1] = parts[-1][:-1] + line
+        else:
+            parts.append(line)
+    return " ".join(parts)
+
+
+class StructuredChunker:
+    """
+    Packs headings and paragraphs of whole documents into token budgeted chunks.
+    """
+
+    def __init__(self, max_tokens=512, min_tokens=None, overlap_tokens=0):
+        """
+        :param max_tokens: Upper bound of the estimated tokens of a chunk.
+        :param min_tokens: Chunks smaller than this are not closed at a heading, so short sections are packed together.
+                           Defaults to a quarter of max_tokens.
+        :param overlap_tokens: Tokens of trailing sentences repeated at the start of the next chunk of the same section.
+        """
+        self.max_tokens = max_tokens
+        self.min_tokens = max_tokens // 4 if min_tokens is None else min_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _pieces(self, text, max_tokens=None):
+        """
+        Splits a block that is over the budget into sentences, sentences over the budget into word runs,
+        and word runs still over the budget (very long words) into character runs.
+        :param max_tokens: The budget of every piece, defaults to the chunk budget.
+        """
+        max_tokens = max_tokens or self.max_tokens
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            yield text, tokens
+            return
+        for sentence in split_sentences(text):
+            sentence_tokens = count_tokens(sentence)
+            if sentence_tokens <= max_tokens:
+                yield sentence, sentence_tokens
+                continue
+            run, run_chars = [], -1
+            for word in sentence.split():
+                # the tokens of the run with this word, counted the same way as count_tokens
+                if run and max((len(run) + 1) * TOKENS_PER_WORD,
+                               (run_chars + 1 + len(word)) / CHARS_PER_TOKEN) > max_tokens:
+                    yield " ".join(run), count_tokens(" ".join(run))
+                    run, run_chars = [], -1
+                if count_tokens(word) <= max_tokens:
+                    run.append(word)
+                    run_chars += 1 + len(word)
+                    continue
+                width = max_tokens * CHARS_PER_TOKEN
+                for offset in range(0, len(word), width):
+                    yield word[offset:offset + width], count_tokens(word[offset:offset + width])
+            if run:
+                yield " ".join(run), count_tokens(" ".join(run))
+
+    def iter_chunks(self, pages):
+        """
+        Chunks a stream of page Documents, one document (doc_hash / source) after the other.
+
+        Pages are consumed lazily, so chunks are produced before the whole document is read.
+        :param pages: An iterable of page Documents in document and page order.
+        :return: A generator of chunk Documents.
+        """
+        current_key = None
+        state = None
+        for page in pages:
+            metadata = page.metadata
+            key = (metadata.get("doc_hash"), metadata.get("source"))
+            if key != current_key:
+                if state is not None:
+                    yield from state.flush()
+                current_key = key
+                state = _ChunkState(self, metadata)
+            yield from state.add_page(page)
+        if state is not None:
+            yield from state.flush()
+
+    def split(self, pages) -> list:
+        """
+        :return: The chunk Documents of all pages as a list.
+        """
+        return list(self.iter_chunks(pages))
+
+
+class _ChunkState:
+    """
+    The chunk being packed for one document.
+    """
+
+    def __init__(self, chunker, metadata):
+        self.chunker = chunker
+        self.base_metadata = {name: metadata[name] for name in ("source", "doc_hash") if name in metadata}
+        self.parts = []
+        self.tokens = 0
+        self.first_page = None
+        self.last_page = None
+        self.heading = None
+        self.chunk_heading = None
+        self.has_body = False
+        self.trailing = [] # (text, page) of the headings appended since the last body text
+        self.before_trailing = None # (last page, heading, chunk heading) of the chunk before its trailing headings
+
+    def add_page(self, page):
+        page_number = page.metadata.get("page")
+        for kind, text in iter_blocks(page.page_content):
+            if kind == "heading":
+                # a heading closes the running chunk, consecutive headings stay together
+                if self.has_body and self.tokens >= self.chunker.min_tokens:
+                    yield from self.flush()
+                if not self.trailing:
+                    self.before_trailing = (self.last_page, self.heading, self.chunk_heading)
+                self.heading = text
+                if self.chunk_heading is None:
+                    self.chunk_heading = text
+                self._append(text, page_number)
+                self.trailing.append((text, page_number))
+                continue
+
+            pieces = deque(self.chunker._pieces(text))
+            first = True
+            while pieces:
+                piece, tokens = pieces.popleft()
+                if self.has_body and self._tokens_with(piece) > self.chunker.max_tokens:
+                    if self.trailing:
+                        yield from self._flush_before_headings()
+                    else:
+                        yield from self.flush(carry_overlap= True)
+
+                # a chunk without body text only holds headings or overlap, which stay with the text that follows,
+                # so the piece is cut to the room they leave instead of closing them in a chunk of their own
+                room = self.chunker.max_tokens - (self._tokens_with("") if self.parts else 0)
+                if tokens > room > 0:
+                    split = list(self.chunker._pieces(piece, room))
+                    (piece, _), rest = split[0], split[1:]
+                    pieces.extendleft(reversed(rest))
+
+                # sentences of one paragraph stay on one line, never on the line of a heading
+                self._append(piece, page_number, same_paragraph= not first and not self.trailing)
+                self.has_body = True
+                self.trailing = []
+                first = False
+
+    def _flush_before_headings(self):
+        """
+        Closes the running chunk without its trailing headings, which open the next chunk instead,
+        so a heading is never the last line of a chunk cut for size.
+        """
+        headings = self.trailing
+        del self.parts[-len(headings):]
+        self.tokens = count_tokens("\n\n".join(self.parts))
+        self.last_page, self.heading, self.chunk_heading = self.before_trailing
+        yield from self.flush()
+
+        for text, page_number in headings:
+            self._append(text, page_number)
+        self.heading = headings[-1][0]
+        self.chunk_heading = headings[0][0]
+
+    def _tokens_with(self, text) -> int:
+        """
+        :return: Estimated tokens of the chunk once text is appended as a new part, separator included.
+                 The estimate of the text alone never adds more than count_tokens(text) to _tokens_with("").
+        """
+        return count_tokens("\n\n".join(self.parts + [text]))
+
+    def _append(self, text, page_number, same_paragraph=False):
+        if not self.parts:
+            self.first_page = page_number
+        if same_paragraph and self.parts:
+            self.parts[-1] = f"{self.parts[-1]} {text}"
+        else:
+            self.parts.append(text)
+        # counted on the joined text, so the separators count against the budget as well
+        self.tokens = count_tokens("\n\n".join(self.parts))
+        self.last_page = page_number
+
+    def flush(self, carry_overlap=False):
+        if not self.parts:
+            return
+        metadata = dict(self.base_metadata)
+        metadata["page"] = self.first_page
+        metadata["page_end"] = self.last_page
+        metadata["heading"] = self.chunk_heading or self.heading or ""
+        metadata["tokens"] = self.tokens
+        yield Document(page_content= "\n\n".join(self.parts), metadata= {k: v for k, v in metadata.items() if v is not None})
+
+        overlap = []
+        if carry_overlap and self.chunker.overlap_tokens:
+            sentences = split_sentences(self.parts[-1])
+            budget = self.chunker.overlap_tokens
+            while sentences and count_tokens(sentences[-1]) <= budget:
+                budget -= count_tokens(sentences[-1])
+                overlap.insert(0, sentences.pop())
+
+        last_page = self.last_page
+        self.parts = []
+        self.tokens = 0
+        self.has_body = False
+        self.trailing = []
+        # a chunk cut for size continues the section of the previous one
+        self.chunk_heading = self.heading if carry_overlap else None
+        if overlap:
+            self._append(" ".join(overlap), last_page)
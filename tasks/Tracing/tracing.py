@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+# This file holds the tracing layer of the pipeline
+# 1 > every stage (ingestion, chunking, embedding, collection build, retrieval, llm, parsing, validation)
+#     runs inside span(stage), which records its duration and the numeric attributes it was given
+# 2 > numeric attributes (tokens, items, retries, cache hits, ...) are summed per stage, failed spans are counted,
+#     add() puts a count on the innermost open span of the calling thread (e.g. a retry deep inside a call)
+# 3 > the totals are exported in the Prometheus text format, finished spans as JSON lines
+# 4 > the pipeline records into the process wide `tracer`, QUIZZIFY_TRACE_PATH appends its spans to a JSON lines file,
+#     start_metrics_server() serves it to Prometheus and render_debug_panel() shows it in the app
+
+
+# upper bounds in seconds of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _StageStats:
+
+    def __init__(self, recent):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.recent = deque(maxlen= recent) # latest durations, for percentiles in the debug panel
+        self.counters = defaultdict(float)
+
+
+class Tracer:
+    """
+    Thread safe collector of stage durations and counters.
+    """
+
+    def __init__(self, jsonl_path=None, max_events=1000, recent_durations=1024, prefix="quizzify"):
+        """
+        :param jsonl_path: Optional file every finished span is appended to as one JSON line.
+        :param max_events: Number of finished spans kept in memory for export and the debug panel.
+        :param recent_durations: Number of durations kept per stage for percentiles.
+        :param prefix: Prefix of the exported metric names.
+        """
+        self.jsonl_path = jsonl_path
+        self.prefix = prefix
+        self.recent_durations = recent_durations
+        self.events = deque(maxlen= max_events)
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local() # open spans of each thread, innermost last
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        """
+        Times the enclosed block as one call of the stage.
+
+        The attributes dictionary is yielded, so the block can add counts it only knows at the end:
+
+            with tracer.span("embedding", items= len(texts)) as span:
+                ...
+                span["cache_hits"] = hits
+        """
+        stack = self._local.__dict__.setdefault("spans", [])
+        stack.append(attributes)
+        start = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as error:
+            attributes["error"] = type(error).__name__
+            raise
+        finally:
+            stack.pop()
+            self.record(stage, time.perf_counter() - start, **attributes)
+
+    def add(self, name, value=1):
+        """
+        Adds to an attribute of the innermost open span of this thread, or to the "other" stage outside of any span.
+        """
+        stack = getattr(self._local, "spans", None)
+        if stack:
+            stack[-1][name] = stack[-1].get(name, 0) + value
+        else:
+            self.count("other", name, value)
+
+    def record(self, stage, duration, **attributes):
+        """
+        Records one finished call of a stage, for durations measured elsewhere.
+        """
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats(self.recent_durations)
+            stats.calls += 1
+            stats.total += duration
+            stats.recent.append(duration)
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[index] += 1
+                    break
+            if "error" in attributes:
+                stats.errors += 1
+            for name, value in attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats.counters[name] += value
+
+            event = {"ts": round(time.time(), 3), "stage": stage, "duration_s": round(duration, 6), **attributes}
+            self.events.append(event)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding= "utf-8") as f:
+                    f.write(json.dumps(event, default= str) + "\n")
+
+    def count(self, stage, name, value=1):
+        """
+        Adds to a counter of a stage outside of a span, e.g. a retry inside a longer call.
+        """
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats(self.recent_durations)
+            stats.counters[name] += value
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self.events.clear()
+
+    def summary(self) -> list:
+        """
+        :return: One dictionary per stage with calls, errors, total / mean / p50 / p95 durations and its counters.
+        """
+        with self._lock:
+            stages = [(stage, stats, sorted(stats.recent), dict(stats.counters)) for stage, stats in self._stages.items()]
+
+        rows = []
+        for stage, stats, recent, counters in stages:
+            row = {
+                "stage": stage,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "total_s": round(stats.total, 4),
+                "mean_ms": round(stats.total / stats.calls * 1000, 3) if stats.calls else None,
+                "p50_ms": round(recent[len(recent) // 2] * 1000, 3) if recent else None,
+                "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3) if recent else None
+            }
+            row.update({name: round(value, 3) for name, value in sorted(counters.items())})
+            rows.append(row)
+        return sorted(rows, key= lambda row: row["total_s"], reverse= True)
+
+    def to_prometheus(self) -> str:
+        """
+        :return: The stage histograms and counters in the Prometheus text exposition format.
+        """
+        with self._lock:
+            stages = [(stage, stats.calls, stats.errors, stats.total, list(stats.buckets), dict(stats.counters))
+                      for stage, stats in sorted(self._stages.items())]
+            counter_names = sorted({name for *_, counters in stages for name in counters})
+
+        duration = f"{self.prefix}_stage_duration_seconds"
+        lines = [f"# HELP {duration} Duration of the pipeline stages.", f"# TYPE {duration} histogram"]
+        for stage, calls, _, total, buckets, _ in stages:
+            if not calls:
+                continue
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'{duration}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{duration}_bucket{{stage="{stage}",le="+Inf"}} {calls}')
+            lines.append(f'{duration}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{duration}_count{{stage="{stage}"}} {calls}')
+
+        errors = f"{self.prefix}_stage_errors_total"
+        lines += [f"# HELP {errors} Failed calls of the pipeline stages.", f"# TYPE {errors} counter"]
+        lines += [f'{errors}{{stage="{stage}"}} {errors_}' for stage, calls, errors_, *_ in stages if calls]
+
+        for name in counter_names:
+            metric = f"{self.prefix}_{name}_total"
+            lines += [f"# HELP {metric} Sum of {name} per pipeline stage.", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{stage="{stage}"}} {counters[name]:g}'
+                      for stage, *_, counters in stages if name in counters]
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self) -> str:
+        """
+        :return: The finished spans kept in memory, one JSON object per line.
+        """
+        with self._lock:
+            events = list(self.events)
+        return "".join(json.dumps(event, default= str) + "\n" for event in events)
+
+
+tracer = Tracer(jsonl_path= os.environ.get("QUIZZIFY_TRACE_PATH"))
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0", source=None):
+    """
+    Serves the Prometheus text of the tracer on http://host:port/metrics from a daemon thread, once per process.
+    :return: The HTTP server.
+    """
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    source = source or tracer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = source.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target= _server.serve_forever, name= "metrics-server", daemon= True).start()
+        return _server
+
+
+def render_debug_panel(source=None):
+    """
+    Shows the stage summary of the tracer in the Streamlit sidebar, with downloads of both export formats.
+    """
+    import streamlit as st
+
+    source = source or tracer
+    with st.sidebar.expander("Pipeline metrics", expanded= False):
+        rows = source.summary()
+        if not rows:
+            st.write("Nothing recorded yet.")
+            return
+        st.dataframe(rows, hide_index= True)
+        st.download_button("Prometheus metrics", source.to_prometheus(), file_name= "metrics.txt")
+        st.download_button("Spans (JSON lines)", source.to_jsonl(), file_name= "spans.jsonl")
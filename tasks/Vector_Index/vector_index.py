@@ -0,0 +1,385 @@
+import os
+import json
+import uuid
+import tempfile
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+# This file creates a compact in-process vector store for small collections
+# 1 > the chunk embeddings are one contiguous float32 matrix with L2 normalized rows
+# 2 > top-k is a single matrix-vector product plus argpartition, scores are cosine similarities
+# 3 > the matrix is saved as a .npy file and memory mapped on load, texts and metadata go to a JSON file
+# 4 > it is a langchain VectorStore, so as_retriever() and similarity_search_with_relevance_scores() work as with Chroma
+# 5 > with precision "float16" or "int8" only the quantized matrix is searched in memory, the float32 matrix
+#     lives in a memory mapped file and is read back only to rescore the top candidates exactly
+# 6 > rows are appended into buffers that double their capacity when full, only the new rows are quantized
+#     and spilled, so a collection added window by window is copied O(log n) times instead of once per window
+
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# rows scored per step when the quantized matrix is upcast, the float32 block (768 KB at 768 dimensions)
+# stays in the CPU cache between the upcast and the dot product
+SCORE_BLOCK_ROWS = 256
+
+# rows of the first buffer allocated by an append
+MIN_CAPACITY = 1024
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """
+    :return: A contiguous float32 copy of the vectors with unit length rows, zero rows stay zero.
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms)
+
+
+def top_k(scores, k) -> np.ndarray:
+    """
+    :return: Indices of the k highest scores, best first.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def quantize(vectors, precision):
+    """
+    :return: (codes, scales), scales is None unless precision is "int8" where row i is codes[i] * scales[i].
+    """
+    if precision == "float32":
+        return vectors, None
+    if precision == "float16":
+        return vectors.astype(np.float16), None
+    # symmetric per row int8, the largest component of every row maps to 127
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.empty(0, dtype=np.float32)
+    scales = scales.astype(np.float32)
+    safe = np.where(scales == 0, 1.0, scales)[:, None]
+    codes = np.clip(np.rint(vectors / safe), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def approximate_scores(codes, scales, query) -> np.ndarray:
+    """
+    Dot products of the query with the quantized rows, upcast block by block into one reused float32 buffer.
+
+    The product is always computed in float32, half precision matrix products are far slower in NumPy.
+    The float16 to float32 conversion itself is not vectorized by every NumPy build, it makes a float16 search
+    up to 10x slower than a float32 one, where int8 (converted with SIMD) is about as fast as float32.
+    """
+    if codes.dtype == np.float32:
+        return codes @ query
+    scores = np.empty(len(codes), dtype=np.float32)
+    block = np.empty((min(SCORE_BLOCK_ROWS, len(codes)),) + codes.shape[1:], dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        rows = codes[start:start + SCORE_BLOCK_ROWS]
+        upcast = block[:len(rows)]
+        upcast[...] = rows
+        np.dot(upcast, query, out= scores[start:start + len(rows)])
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def spill(matrix) -> np.ndarray:
+    """
+    Moves a float32 matrix into a memory mapped anonymous temporary file, so its pages can leave memory.
+    """
+    if len(matrix) == 0:
+        return matrix
+    mapped = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=matrix.shape)
+    mapped[:] = matrix
+    mapped.flush()
+    return mapped
+
+
+def grow(buffer, used, rows, spilled=False) -> np.ndarray:
+    """
+    :param buffer: A buffer whose first used rows are filled.
+    :param rows: Number of rows the buffer must hold.
+    :param spilled: Allocate a memory mapped anonymous temporary file instead of memory.
+    :return: buffer itself when it holds rows rows, else a new buffer of at least twice its capacity
+             holding its first used rows.
+    """
+    if len(buffer) >= rows:
+        return buffer
+    shape = (max(rows, 2 * len(buffer), MIN_CAPACITY),) + buffer.shape[1:]
+    if spilled:
+        grown = np.memmap(tempfile.TemporaryFile(), dtype=buffer.dtype, mode="w+", shape=shape)
+    else:
+        grown = np.empty(shape, dtype=buffer.dtype)
+    grown[:used] = buffer[:used]
+    return grown
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    A vector store holding every embedding of a collection in one NumPy matrix.
+
+    Writers append rows in place past the rows readers can see, or build new arrays and swap them in (delete),
+    always under a lock. Readers search the views they started with.
+    """
+
+    def __init__(self, embedding, vectors=None, ids=None, texts=None, metadatas=None, precision="float32",
+                 rescore_factor=4):
+        """
+        :param embedding: The langchain Embeddings used for the texts and queries.
+        :param vectors: Optional (n, dim) array of already normalized vectors, may be a read-only memory map.
+        :param precision: "float32", "float16" (2x smaller, slower to search, see approximate_scores) or "int8"
+                          (4x smaller, plus one float32 scale per row) storage of the searched matrix.
+        :param rescore_factor: With a quantized matrix, k * rescore_factor candidates are rescored in float32.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
+        self.embedding = embedding
+        self.precision = precision
+        self.rescore_factor = rescore_factor
+        self._lock = threading.Lock()
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._codes = self._vectors
+        self._scales = None
+        self._buffers = (self._vectors, self._codes, None) # the arrays viewed by _vectors, _codes and _scales
+        if vectors is not None:
+            self._set_vectors(vectors if isinstance(vectors, np.memmap) else np.asarray(vectors, dtype=np.float32))
+        self._ids = list(ids or [])
+        self._texts = list(texts or [])
+        self._metadatas = [dict(metadata) for metadata in (metadatas or [{} for _ in self._ids])]
+        self._positions = {id_: position for position, id_ in enumerate(self._ids)}
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def _set_vectors(self, vectors):
+        # callers hold the lock, the full precision rows leave memory when a quantized copy is searched
+        codes, scales = quantize(vectors, self.precision)
+        if self.precision != "float32" and not isinstance(vectors, np.memmap):
+            vectors = spill(vectors)
+        self._vectors, self._codes, self._scales = vectors, codes, scales
+        self._buffers = (vectors, codes, scales)
+
+    def _append_vectors(self, vectors):
+        # callers hold the lock, readers only see the first size rows, so the new rows are written in place
+        size = len(self._vectors)
+        rows = size + len(vectors)
+        full, codes, scales = self._buffers
+        if size == 0:
+            full = np.empty((0, vectors.shape[1]), dtype=np.float32)
+            codes = full if self.precision == "float32" else np.empty((0, vectors.shape[1]), dtype=self.precision)
+            scales = np.empty(0, dtype=np.float32) if self.precision == "int8" else None
+
+        quantized = self.precision != "float32"
+        full = grow(full, size, rows, spilled= quantized)
+        full[size:rows] = vectors
+        if quantized:
+            new_codes, new_scales = quantize(vectors, self.precision)
+            codes = grow(codes, size, rows)
+            codes[size:rows] = new_codes
+            if scales is not None:
+                scales = grow(scales, size, rows)
+                scales[size:rows] = new_scales
+        else:
+            codes = full
+
+        self._buffers = (full, codes, scales)
+        self._vectors, self._codes = full[:rows], codes[:rows]
+        self._scales = scales[:rows] if scales is not None else None
+
+    def _keep_rows(self, rows):
+        # callers hold the lock, the kept codes are not quantized again and the spilled rows are copied
+        # block by block, so the float32 matrix is never read into memory at once
+        if self.precision == "float32" or len(rows) == 0:
+            self._set_vectors(np.asarray(self._vectors)[rows])
+            return
+        full = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=(len(rows), self._vectors.shape[1]))
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            full[start:start + SCORE_BLOCK_ROWS] = self._vectors[rows[start:start + SCORE_BLOCK_ROWS]]
+        codes = self._codes[rows]
+        scales = self._scales[rows] if self._scales is not None else None
+        self._vectors, self._codes, self._scales = full, codes, scales
+        self._buffers = (full, codes, scales)
+
+    def index_nbytes(self) -> int:
+        """
+        :return: Bytes of the in-memory matrix searched per query (plus int8 scales).
+        """
+        with self._lock:
+            codes, scales = self._codes, self._scales
+        return codes.nbytes + (scales.nbytes if scales is not None else 0)
+
+    def _embed_texts(self, texts) -> np.ndarray:
+        # batched clients hand back one contiguous array, others a list of lists
+        if hasattr(self.embedding, "embed_array"):
+            return self.embedding.embed_array(texts)
+        return np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> list:
+        """
+        Embeds and adds texts, texts whose id is already in the store are skipped.
+        :return: The ids of the given texts.
+        """
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in texts]
+        ids = list(ids)
+
+        new = [index for index, id_ in enumerate(ids) if id_ not in self._positions]
+        if new:
+            vectors = normalize_rows(self._embed_texts([texts[index] for index in new]))
+            self.add_vectors(vectors, [ids[index] for index in new], [texts[index] for index in new],
+                             [metadatas[index] for index in new])
+        return ids
+
+    def add_vectors(self, vectors, ids, texts, metadatas):
+        """
+        Appends already normalized vectors, only the new rows are quantized and spilled.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        if len(vectors) == 0:
+            return
+        with self._lock:
+            start = len(self._ids)
+            self._append_vectors(vectors)
+            # appended in place as well, readers never index past the rows of the views they took
+            self._ids.extend(ids)
+            self._texts.extend(texts)
+            self._metadatas.extend(dict(metadata or {}) for metadata in metadatas)
+            self._positions.update((id_, start + offset) for offset, id_ in enumerate(ids))
+
+    def delete(self, ids=None, **kwargs):
+        """
+        Removes the given ids, unknown ids are ignored.
+        """
+        doomed = {id_ for id_ in (ids or []) if id_ in self._positions}
+        if not doomed:
+            return False
+        with self._lock:
+            keep = [position for position, id_ in enumerate(self._ids) if id_ not in doomed]
+            self._keep_rows(np.array(keep, dtype=np.int64))
+            self._ids = [self._ids[position] for position in keep]
+            self._texts = [self._texts[position] for position in keep]
+            self._metadatas = [self._metadatas[position] for position in keep]
+            self._positions = {id_: position for position, id_ in enumerate(self._ids)}
+        return True
+
+    def get_ids(self) -> list:
+        return list(self._ids)
+
+    def get_by_ids(self, ids) -> list:
+        """
+        :return: The Documents of the given ids in the given order, unknown ids are skipped.
+        """
+        with self._lock:
+            positions, texts, metadatas = self._positions, self._texts, self._metadatas
+            rows = [(id_, positions[id_]) for id_ in ids if id_ in positions]
+            return [Document(id=id_, page_content=texts[row], metadata=dict(metadatas[row])) for id_, row in rows]
+
+    def get_vectors(self, ids) -> np.ndarray:
+        """
+        :return: The float32 unit vectors of the given ids, row i belonging to ids[i].
+        :raises KeyError: When an id is not in the store.
+        """
+        with self._lock:
+            vectors = self._vectors
+            rows = np.array([self._positions[id_] for id_ in ids], dtype=np.int64)
+        return np.asarray(vectors[rows], dtype=np.float32).reshape(len(rows), -1)
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4) -> list:
+        """
+        :return: (Document, cosine similarity) pairs of the k nearest chunks, best first.
+        """
+        with self._lock:
+            vectors, codes, scales = self._vectors, self._codes, self._scales
+            texts, metadatas = self._texts, self._metadatas
+        if len(texts) == 0:
+            return []
+        query = normalize_rows(embedding)[0]
+        scores = approximate_scores(codes, scales, query)
+        if codes is vectors:
+            indices = top_k(scores, k)
+            exact = scores[indices]
+        else:
+            # exact float32 rescoring of the best quantized candidates
+            candidates = np.sort(top_k(scores, k * self.rescore_factor))
+            candidate_scores = np.asarray(vectors[candidates]) @ query
+            order = top_k(candidate_scores, k)
+            indices, exact = candidates[order], candidate_scores[order]
+        return [
+            (Document(page_content=texts[index], metadata=dict(metadatas[index])), float(score))
+            for index, score in zip(indices, exact)
+        ]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs) -> list:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs) -> list:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs) -> list:
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # cosine similarity of unit vectors mapped from [-1, 1] to [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def save(self, directory):
+        """
+        Writes the matrix and the records to a directory, replacing an earlier save.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            vectors, ids, texts, metadatas = self._vectors, self._ids, self._texts, self._metadatas
+
+        # written under temporary names and renamed, so a concurrent load never sees half a file
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        records_path = os.path.join(directory, RECORDS_FILE)
+        with open(vectors_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f)
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(records_path + ".tmp", records_path)
+
+    @classmethod
+    def load(cls, directory, embedding, mmap=True, **kwargs):
+        """
+        :param mmap: Memory map the matrix read-only instead of reading it into memory.
+        :param kwargs: precision and rescore_factor of the loaded store, the quantized matrix is rebuilt on load.
+        :return: The saved store, or None if the directory holds no store.
+        """
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        records_path = os.path.join(directory, RECORDS_FILE)
+        if not (os.path.exists(vectors_path) and os.path.exists(records_path)):
+            return None
+        with open(records_path, encoding="utf-8") as f:
+            records = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode="r" if mmap else None)
+        if len(vectors) != len(records["ids"]):
+            return None
+        return cls(embedding, vectors, records["ids"], records["texts"], records["metadatas"], **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_documents(cls, documents, embedding, ids=None, **kwargs):
+        documents = list(documents)
+        return cls.from_texts([document.page_content for document in documents], embedding,
+                              metadatas=[document.metadata for document in documents], ids=ids, **kwargs)
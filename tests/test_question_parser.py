@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tasks.Question_Parser.question_parser import is_valid_question, parse_question, parse_question_batch
+
+
+def make_question(**fields):
+    question = {
+        "question": "Which gas do plants absorb?",
+        "choices": [{"key": "A", "value": "Oxygen"}, {"key": "B", "value": "Carbon dioxide"}],
+        "answer": "B",
+        "explanation": "Plants absorb carbon dioxide for photosynthesis."
+    }
+    question.update(fields)
+    return question
+
+
+def test_valid_question_is_accepted():
+    assert is_valid_question(make_question())
+    assert parse_question(json.dumps(make_question())) == make_question()
+
+
+def test_unhashable_answer_is_rejected():
+    assert not is_valid_question(make_question(answer=["B"]))
+    assert not is_valid_question(make_question(answer={"key": "B"}))
+    assert parse_question(json.dumps(make_question(answer=["B"]))) is None
+
+
+def test_unhashable_choice_key_is_rejected():
+    choices = [{"key": ["A"], "value": "Oxygen"}, {"key": "B", "value": "Carbon dioxide"}]
+    assert not is_valid_question(make_question(choices=choices))
+
+
+def test_batch_keeps_the_valid_items():
+    items = [make_question(answer=["B"]), make_question(question="Which gas do animals exhale?")]
+    questions = parse_question_batch(json.dumps(items))
+    assert [question["question"] for question in questions] == ["Which gas do animals exhale?"]
@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tasks.Quiz_Manager.quiz_manager import QuizManager
+
+
+def test_generation_error_is_kept():
+    def question_stream():
+        yield {"question": "second"}
+        raise RuntimeError("quota exhausted")
+
+    quiz_manager = QuizManager([{"question": "first"}], expected_questions= 5)
+    quiz_manager.follow(question_stream()).join()
+    assert quiz_manager.total_questions == 2
+    assert quiz_manager.is_complete()
+    assert str(quiz_manager.error) == "quota exhausted"
+
+
+def test_complete_stream_has_no_error():
+    quiz_manager = QuizManager([], expected_questions= 2)
+    quiz_manager.follow(iter([{"question": "a"}, {"question": "b"}])).join()
+    assert quiz_manager.error is None and quiz_manager.total_questions == 2
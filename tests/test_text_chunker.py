@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.documents import Document
+
+from tasks.Text_Chunker.text_chunker import StructuredChunker, count_tokens
+
+
+HEADINGS = ["INTRODUCTION TO THINGS", "Second Heading Here"]
+
+
+def paragraph(sentences):
+    return " ".join(f"The membrane protein number {index} moves energy across the cell." for index in range(sentences))
+
+
+def chunk(text, **kwargs):
+    return StructuredChunker(**kwargs).split([Document(page_content= text, metadata= {"source": "a.pdf", "page": 0})])
+
+
+def test_headings_before_an_overflowing_paragraph_stay_with_it():
+    # a single run of words that fits a chunk alone but not after the headings
+    run = " ".join(["energy"] * 95)
+    chunks = chunk("\n\n".join(HEADINGS + [run]), max_tokens= 128)
+    assert chunks[0].page_content.startswith("\n\n".join(HEADINGS) + "\n\nenergy")
+    assert count_tokens(chunks[0].page_content) <= 128
+    assert all(set(document.page_content.split("\n\n")) - set(HEADINGS) for document in chunks)
+
+
+def test_carried_headings_count_against_the_budget():
+    text = "\n\n".join([paragraph(3), "Second Heading Here", paragraph(12), "SUMMARY", paragraph(30)])
+    for overlap_tokens in (0, 20):
+        for document in chunk(text, max_tokens= 128, overlap_tokens= overlap_tokens):
+            assert count_tokens(document.page_content) <= 128
+            assert document.metadata["tokens"] == count_tokens(document.page_content)
+            assert document.page_content.split("\n\n")[-1] not in HEADINGS + ["SUMMARY"]
+
+
+def test_text_without_spaces_is_split_to_the_budget():
+    chunks = chunk("x" * 20000, max_tokens= 512)
+    assert len(chunks) == 10
+    assert max(count_tokens(document.page_content) for document in chunks) <= 512